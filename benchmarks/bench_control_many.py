@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+spread of the CMD_SET arrival across a group of devices, one by one vs group.control_many
+every device is a simulator.SimulatedDevice on its own loopback address that answers after a random delay
+needs the integration requirements (homeassistant, requests) importable
+python benchmarks/bench_control_many.py [devices] [max device delay ms] [seed]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+from custom_components.hass_cozylife_local_pull.async_tcp_client import async_tcp_client
+from custom_components.hass_cozylife_local_pull.channel import DeviceChannel
+from custom_components.hass_cozylife_local_pull.group import control_many
+from simulator import SimulatedDevice
+
+
+def report(name: str, start: float, end: float, devices: list) -> None:
+    offsets = sorted((device.set_at - start) * 1000 for device in devices)
+    print(f'{name:>12}: {len(offsets)} devices, first {offsets[0]:7.1f} ms, median {statistics.median(offsets):7.1f} ms,'
+          f' last {offsets[-1]:7.1f} ms, spread {offsets[-1] - offsets[0]:7.1f} ms, done after {(end - start) * 1000:7.1f} ms')
+
+
+async def main(count: int, max_delay: float, seed: int) -> None:
+    rnd = random.Random(seed)
+    # the delay of each device before it answers
+    devices = [SimulatedDevice(i, latency=rnd.uniform(0, max_delay), seed=seed) for i in range(count)]
+    await asyncio.gather(*(device.start(0) for device in devices))
+
+    clients = []
+    for device in devices:
+        client = async_tcp_client(device.ip, write_window=0, info=device.info())
+        client._port = device.port
+        client.start()
+        clients.append(client)
+
+    while not all(client.connected for client in clients):
+        await asyncio.sleep(0.01)
+
+    # what a scene of separate turn_on calls does
+    start = time.perf_counter()
+    for client in clients:
+        await client.async_control({'1': 255}, wait=True)
+    report('one by one', start, time.perf_counter(), devices)
+
+    start = time.perf_counter()
+    result = await control_many([DeviceChannel(client) for client in clients], {'1': 0})
+    report('control_many', start, time.perf_counter(), devices)
+    print(f'{sum(result.values())}/{len(result)} acked')
+
+    for client in clients:
+        await client.async_stop()
+    await asyncio.gather(*(device.stop() for device in devices))
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 30,
+                     (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000,
+                     int(sys.argv[3]) if len(sys.argv) > 3 else 0))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark protocol.FrameDecoder on tcp input cut at recv sizes
+make_frames is shared with the fuzz test in tests/test_protocol.py
+python benchmarks/bench_frame_decoder.py [seed]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'hass_cozylife_local_pull'))
+from protocol import FrameDecoder
+
+
+def make_frames(rnd: random.Random, count: int) -> list:
+    frames = []
+    for i in range(count):
+        sn = str(1636463611798 + i)
+        kind = rnd.randrange(4)
+        if 0 == kind:
+            frame = {'cmd': 2, 'pv': 0, 'sn': sn, 'res': 0, 'msg': {'attr': [1, 2, 3, 4, 5, 6], 'data': {
+                '1': rnd.choice([0, 255]), '2': 0, '3': rnd.randrange(1001), '4': rnd.randrange(1001),
+                '5': rnd.randrange(360), '6': rnd.randrange(1001)}}}
+        elif 1 == kind:
+            frame = {'cmd': 3, 'pv': 0, 'sn': sn, 'res': 0, 'msg': {'attr': [1], 'data': {'1': 0}}}
+        elif 2 == kind:
+            frame = {'cmd': 10, 'pv': 0, 'sn': sn, 'res': 0, 'msg': {'attr': [1, 2, 3, 4, 5, 6], 'data': {
+                '1': 0, '2': 0, '3': 1000, '4': 1000, '5': 65535, '6': 65535}}}
+        else:
+            # bigger than the old recv(1024)
+            frame = {'cmd': 0, 'pv': 0, 'sn': sn, 'res': 0, 'msg': {'did': '629168597cb94c4c1d8f', 'pid': 'e2s64v',
+                                                                    'pad': 'x' * rnd.randrange(1024, 4096)}}
+        frames.append(frame)
+
+    return frames
+
+
+def bench(seed: int, count: int = 20000) -> None:
+    rnd = random.Random(seed)
+    frames = [item for item in make_frames(rnd, count) if item['cmd'] != 0]
+    stream = b''.join(json.dumps(item, separators=(',', ':')).encode() + b'\r\n' for item in frames)
+
+    for name, chunk_size in (('recv(1024)', 1024), ('recv(4096)', 4096), ('recv(64)', 64)):
+        chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+        decoder = FrameDecoder()
+        start = time.perf_counter()
+        decoded = 0
+        for chunk in chunks:
+            decoded += len(decoder.feed(chunk))
+        elapsed = time.perf_counter() - start
+        assert decoded == len(frames)
+        print(f'{name:>10}: {decoded / elapsed:12,.0f} frames/s, {len(stream) / elapsed / 1e6:8.2f} MB/s')
+
+
+if __name__ == '__main__':
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    bench(seed)
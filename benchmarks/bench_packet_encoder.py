@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark protocol.PacketEncoder against the dict + json.dumps encoder it replaced
+python benchmarks/bench_packet_encoder.py [count]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'hass_cozylife_local_pull'))
+import protocol
+from protocol import CMD_INFO, CMD_QUERY, CMD_SET, PacketEncoder
+
+
+def legacy_get_package(cmd: int, sn: str, payload: dict) -> bytes:
+    if CMD_SET == cmd:
+        message = {'pv': 0, 'cmd': cmd, 'sn': sn, 'msg': {'attr': [int(item) for item in payload.keys()],
+                                                          'data': payload}}
+    elif CMD_QUERY == cmd:
+        message = {'pv': 0, 'cmd': cmd, 'sn': sn, 'msg': {'attr': [0]}}
+    elif CMD_INFO == cmd:
+        message = {'pv': 0, 'cmd': cmd, 'sn': sn, 'msg': {}}
+    else:
+        raise Exception('CMD is not valid')
+
+    payload_str = json.dumps(message, separators=(',', ':',))
+    return bytes(payload_str + "\r\n", encoding='utf8')
+
+
+CASES = [
+    ('info', CMD_INFO, {}),
+    ('query', CMD_QUERY, {}),
+    ('set on/off', CMD_SET, {'1': 255}),
+    # one frame of a color transition
+    ('set color', CMD_SET, {'1': 255, '2': 0, '4': 730, '5': 212, '6': 840}),
+]
+
+
+def check() -> None:
+    sn = '1636463553873'
+    # values that are not int take the json encoder
+    for name, cmd, payload in CASES + [('set other', CMD_SET, {'1': True, '7': 'scene', '8': [1, 2]})]:
+        assert PacketEncoder().encode(cmd, sn, payload) == legacy_get_package(cmd, sn, payload), name
+
+    print(f'check: encoders agree, orjson={"yes" if protocol.orjson is not None else "no"}')
+
+
+def bench(count: int) -> None:
+    encoder = PacketEncoder()
+    sns = [str(1636463553873 + i) for i in range(count)]
+    for name, cmd, payload in CASES:
+        result = []
+        for label, encode in (('legacy', legacy_get_package), ('encoder', encoder.encode)):
+            start = time.perf_counter()
+            for sn in sns:
+                encode(cmd, sn, payload)
+            elapsed = time.perf_counter() - start
+            result.append(count / elapsed)
+            print(f'{name:>10} {label:>8}: {count / elapsed:12,.0f} frames/s, {elapsed / count * 1e9:7.0f} ns/frame')
+        print(f'{name:>10} {"speedup":>8}: {result[1] / result[0]:12.1f}x')
+
+
+if __name__ == '__main__':
+    check()
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
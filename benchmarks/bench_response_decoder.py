@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+replay recorded traffic through the response decoder, against the str(bytes) scan + json.loads it replaced
+the capture is the wire trace of a home assistant log, record one with
+  logger: logs: custom_components.hass_cozylife_local_pull.protocol.wire: debug
+python benchmarks/bench_response_decoder.py [home-assistant.log] [rounds]
+"""
+import ast
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'hass_cozylife_local_pull'))
+import protocol
+from protocol import FrameDecoder
+
+SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'traffic.log')
+TRACE = re.compile(r'protocol\.wire\] (\S+) < (b[\'"].*)$')
+
+
+def load(path: str) -> dict:
+    """
+    :param path:
+    :return: ip -> chunks received, in order
+    """
+    streams = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            match = TRACE.search(line.rstrip('\n'))
+            if match is not None:
+                streams.setdefault(match.group(1), []).append(ast.literal_eval(match.group(2)))
+
+    return streams
+
+
+def legacy(streams: dict) -> int:
+    """
+    what every recv went through before: a chunk is one frame, found by its sn in str(bytes)
+    :param streams:
+    :return: frames carrying data
+    """
+    count = 0
+    for chunks in streams.values():
+        for res in chunks:
+            # the reply waiter looked for its sn in every chunk
+            if '"sn"' in str(res):
+                try:
+                    payload = json.loads(res.strip())
+                except ValueError:
+                    continue
+                if payload is None or len(payload) == 0:
+                    continue
+                if payload.get('msg') is None or type(payload['msg']) is not dict:
+                    continue
+                if payload['msg'].get('data') is None or type(payload['msg']['data']) is not dict:
+                    continue
+                count += 1
+
+    return count
+
+
+def decoder(streams: dict) -> int:
+    """
+    one FrameDecoder per connection, every frame parsed once into a Message
+    :param streams:
+    :return: frames carrying data
+    """
+    count = 0
+    for chunks in streams.values():
+        frame_decoder = FrameDecoder()
+        for chunk in chunks:
+            for message in frame_decoder.feed(chunk):
+                if message.data is not None:
+                    count += 1
+
+    return count
+
+
+def bench(path: str, rounds: int) -> None:
+    streams = load(path)
+    frames = decoder(streams)
+    chunks = sum(len(item) for item in streams.values())
+    size = sum(len(chunk) for item in streams.values() for chunk in item)
+    print(f'{os.path.basename(path)}: {len(streams)} devices, {chunks} reads, {size} bytes, {frames} frames with data,'
+          f' orjson={"yes" if protocol.orjson is not None else "no"}')
+
+    for name, function in (('legacy', legacy), ('decoder', decoder)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            count = function(streams)
+        elapsed = time.perf_counter() - start
+        # the legacy path loses the frames that share or split a read
+        print(f'{name:>8}: {count * rounds / elapsed:10,.0f} frames/s, {size * rounds / elapsed / 1e6:6.2f} MB/s,'
+              f' {count} frames with data decoded')
+
+
+if __name__ == '__main__':
+    bench(sys.argv[1] if len(sys.argv) > 1 else SAMPLE, int(sys.argv[2]) if len(sys.argv) > 2 else 200)
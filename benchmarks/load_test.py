@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+load test of the integration against simulator.py devices running in a child process
+measures discovery time, startup time, command latency percentiles, cpu and ram per device
+needs linux (127.1.x.y loopback addresses) and the integration requirements (homeassistant, requests)
+python benchmarks/load_test.py [devices] [--latency MS] [--jitter MS] [--fragment RATE] [--drop RATE] [--rounds N]
+    [--poll-interval S] [--max-polls N]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from custom_components.hass_cozylife_local_pull import udp_discover
+from custom_components.hass_cozylife_local_pull.async_tcp_client import async_tcp_client
+from custom_components.hass_cozylife_local_pull.poll import PollScheduler
+from custom_components.hass_cozylife_local_pull.reconnect import ReconnectScheduler
+from custom_components.hass_cozylife_local_pull.udp_discover import EVENT_ADD, DiscoveryService
+from custom_components.hass_cozylife_local_pull.utils import set_pid_list
+
+SIMULATOR = os.path.join(os.path.dirname(__file__), 'simulator.py')
+# the two models simulator.py serves
+PID_LIST = [
+    {'c': '00', 'm': [{'pid': 'p93sfg', 'i': '', 'n': 'Plug', 'dpid': [1]}]},
+    {'c': '01', 'm': [{'pid': 'e2s64v', 'i': '', 'n': 'Bulb', 'dpid': [1, 2, 3, 4, 5, 6]}]},
+]
+
+
+def percentiles(values: list) -> str:
+    if not values:
+        return 'no samples'
+    values = sorted(values)
+
+    def at(share: float) -> float:
+        return values[min(len(values) - 1, int(share * len(values)))] * 1000
+
+    return f'p50 {at(0.5):7.1f} ms, p90 {at(0.9):7.1f} ms, p99 {at(0.99):7.1f} ms, max {values[-1] * 1000:7.1f} ms'
+
+
+def rss_kb() -> int:
+    """
+    resident memory now, linux only
+    :return:
+    """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+async def wait_for(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def timed(coro) -> tuple:
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def run(args) -> None:
+    set_pid_list(PID_LIST)
+    async_tcp_client._port = args.tcp_port
+    udp_discover.DISCOVER_PORT = args.udp_port
+
+    # discovery: every device answers the broadcast
+    records = {}
+
+    def discovery_event(event: str, record: dict) -> None:
+        if EVENT_ADD == event:
+            records[record['did']] = record
+
+    discovery = DiscoveryService(discovery_event, '127.255.255.255')
+    start = time.perf_counter()
+    await discovery.async_start()
+    found = await wait_for(lambda: len(records) >= args.devices, args.timeout)
+    print(f'discovery: {len(records)}/{args.devices} devices in {time.perf_counter() - start:.2f} s'
+          + ('' if found else ' (timeout)'))
+    await discovery.async_stop()
+
+    # startup: a client per record, connects capped by the scheduler
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = rss_kb()
+    cpu_before = time.process_time()
+    scheduler = ReconnectScheduler(args.max_connects)
+    poller = None
+    if args.poll_interval:
+        poller = PollScheduler(args.poll_interval, max_rate=args.max_polls)
+        poller.start()
+    start = time.perf_counter()
+    clients = []
+    for record in records.values():
+        client = async_tcp_client(record['ip'], args.write_window / 1000, scheduler=scheduler, poller=poller,
+                                  info=None if args.handshake else record)
+        client.start()
+        clients.append(client)
+    ready = await wait_for(lambda: all(client.available and client.state for client in clients), args.timeout)
+    elapsed = time.perf_counter() - start
+    print(f'startup: {sum(client.available for client in clients)}/{len(clients)} connected with state in'
+          f' {elapsed:.2f} s' + ('' if ready else ' (timeout)') + f', cpu {time.process_time() - cpu_before:.2f} s')
+
+    if not clients:
+        return
+
+    # commands: every device at once, rounds one after the other
+    controls = []
+    queries = []
+    failed = 0
+    cpu_before = time.process_time()
+    for i in range(args.rounds):
+        results = await asyncio.gather(*(timed(client.async_control({'1': 255 if i % 2 else 0}, wait=True))
+                                         for client in clients))
+        failed += sum(not result for result, _ in results)
+        controls += [elapsed for result, elapsed in results if result]
+        results = await asyncio.gather(*(timed(client.async_query()) for client in clients))
+        failed += sum(not result for result, _ in results)
+        queries += [elapsed for result, elapsed in results if result]
+    cpu_commands = time.process_time() - cpu_before
+    commands = 2 * args.rounds * len(clients)
+    print(f'control: {percentiles(controls)}')
+    print(f'  query: {percentiles(queries)}')
+    print(f'commands: {commands}, failed {failed}, cpu {cpu_commands / commands * 1e6:.0f} us per command')
+
+    # idle: only the polls and the reports of the devices
+    cpu_before = time.process_time()
+    frames_before = sum(client.health.frames_out for client in clients)
+    polls_before = (poller.polls, poller.skipped) if poller is not None else None
+    # most frames sent in any second, what the access points see
+    peak = 0
+    for _ in range(int(args.idle)):
+        sent = sum(client.health.frames_out for client in clients)
+        await asyncio.sleep(1)
+        peak = max(peak, sum(client.health.frames_out for client in clients) - sent)
+    cpu_idle = time.process_time() - cpu_before
+    frames = sum(client.health.frames_out for client in clients) - frames_before
+    print(f'idle: cpu {cpu_idle / args.idle * 100:.2f} % of a core, {cpu_idle / args.idle / len(clients) * 1e6:.1f}'
+          f' us/s per device, {frames / args.idle:.1f} queries/s, peak {peak}/s')
+    if poller is not None:
+        print(f'poller: {poller.polls - polls_before[0]} polls, {poller.skipped - polls_before[1]} skipped'
+              f' (pushed since the last poll), {poller.queue} queued')
+
+    rss_after = rss_kb()
+    line = f'ram: rss +{(rss_after - rss_before) / len(clients):.1f} KiB per device'
+    if args.tracemalloc:
+        current, _ = tracemalloc.get_traced_memory()
+        line += f', python heap {current / len(clients) / 1024:.1f} KiB per device'
+        tracemalloc.stop()
+    print(line)
+
+    if poller is not None:
+        await poller.async_stop()
+    await asyncio.gather(*(client.async_stop() for client in clients))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='load test against simulated CozyLife devices')
+    parser.add_argument('devices', type=int, nargs='?', default=200)
+    parser.add_argument('--latency', type=float, default=5, help='ms before every device answer')
+    parser.add_argument('--jitter', type=float, default=20, help='ms added at random to the latency')
+    parser.add_argument('--fragment', type=float, default=0.1, help='share of answers written in pieces')
+    parser.add_argument('--drop', type=float, default=0.0, help='share of requests never answered')
+    parser.add_argument('--report', type=float, default=None, help='seconds between cmd=10 reports')
+    parser.add_argument('--rounds', type=int, default=10, help='control + query rounds over all devices')
+    parser.add_argument('--idle', type=float, default=5, help='seconds of idle cpu measurement')
+    parser.add_argument('--write-window', type=float, default=0, help='ms, see the write_window option')
+    parser.add_argument('--max-connects', type=int, default=8)
+    parser.add_argument('--poll-interval', type=float, default=None,
+                        help='s, poll through a PollScheduler instead of each client on its own')
+    parser.add_argument('--max-polls', type=float, default=5, help='queries per second with --poll-interval')
+    parser.add_argument('--handshake', action='store_true', help='connect with CMD_INFO, not the discovery record')
+    parser.add_argument('--tracemalloc', action='store_true', help='also measure the python heap, slows it all')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--tcp-port', type=int, default=5555)
+    parser.add_argument('--udp-port', type=int, default=6095)
+    args = parser.parse_args()
+
+    command = [sys.executable, SIMULATOR, str(args.devices), '--latency', str(args.latency),
+               '--jitter', str(args.jitter), '--fragment', str(args.fragment), '--drop', str(args.drop),
+               '--tcp-port', str(args.tcp_port), '--udp-port', str(args.udp_port)]
+    if args.report:
+        command += ['--report', str(args.report)]
+    # the devices run in their own process, so cpu and ram here are the integration's only
+    simulator = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        line = simulator.stdout.readline()
+        if not line.startswith('ready'):
+            raise SystemExit(f'simulator did not start: {line!r}')
+        asyncio.run(run(args))
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+replay a captured frame stream through the per-packet hot path and compare with a stored baseline
+stages: encode (PacketEncoder), decode (FrameDecoder), state (DeviceState, as the light entity reads it),
+discovery (udp_discover.parse_reply)
+the capture is the protocol.wire debug trace of a home assistant log, see bench_response_decoder.py
+python benchmarks/replay.py [--capture home-assistant.log] [--save] [--tolerance 0.2]
+exits with 1 when a stage is slower or allocates more than the baseline allows
+speed is stored relative to a plain python calibration loop timed in the same run, so the baseline
+holds across machines and load; the raw frames/s are printed for information only
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+PACKAGE = os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'hass_cozylife_local_pull')
+sys.path.insert(0, PACKAGE)
+sys.path.insert(0, os.path.dirname(__file__))
+from protocol import CMD_INFO, FrameDecoder, PacketEncoder
+from bench_response_decoder import SAMPLE, load
+
+# state.py imports .const, load it from the package directory without __init__ and its homeassistant imports
+sys.modules.setdefault('cozylife', types.ModuleType('cozylife')).__path__ = [PACKAGE]
+from cozylife.state import DeviceState
+from cozylife.udp_discover import parse_reply
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'data', 'baseline.json')
+
+
+def prepare(streams: dict) -> dict:
+    """
+    the inputs of every stage, decoded once from the capture
+    :param streams: ip -> chunks
+    :return: stage -> list of inputs, one per frame
+    """
+    messages = []
+    for ip, chunks in streams.items():
+        decoder = FrameDecoder()
+        for chunk in chunks:
+            messages += [(ip, message) for message in decoder.feed(chunk)]
+
+    return {
+        # the request each answer was for
+        'encode': [(message.cmd, message.sn, message.data or {}) for _, message in messages
+                   if message.cmd in (0, 2, 3)],
+        'decode': list(streams.values()),
+        'state': [message.data for _, message in messages if message.data is not None],
+        # cmd 0 answers, as discovery datagrams
+        'discovery': [(json.dumps({'cmd': 0, 'pv': 0, 'sn': message.sn, 'msg': message.msg, 'res': 0}).encode(), ip)
+                      for ip, message in messages if CMD_INFO == message.cmd],
+    }
+
+
+def run_encode(inputs: list, keep: list) -> int:
+    encoder = PacketEncoder()
+    for cmd, sn, data in inputs:
+        keep.append(encoder.encode(cmd, sn, data))
+    return len(inputs)
+
+
+def run_decode(inputs: list, keep: list) -> int:
+    count = 0
+    for chunks in inputs:
+        decoder = FrameDecoder()
+        for chunk in chunks:
+            frames = decoder.feed(chunk)
+            count += len(frames)
+            keep += frames
+    return count
+
+
+def run_state(inputs: list, keep: list) -> int:
+    state = DeviceState()
+    for data in inputs:
+        state.update(data)
+        # what CozyLifeLight._refresh_state reads
+        keep.append((state.on, state.brightness, state.hs_color, state.color_temp))
+    return len(inputs)
+
+
+def run_discovery(inputs: list, keep: list) -> int:
+    for data, ip in inputs:
+        keep.append(parse_reply(data, ip))
+    return len(inputs)
+
+
+def run_calibration(inputs: list, keep: list) -> int:
+    """
+    plain python of the kind the stages run: small dicts, str keys, json text
+    :param inputs: ints
+    :param keep:
+    :return:
+    """
+    for i in inputs:
+        data = {'1': i, '2': str(i)}
+        keep.append(json.dumps(data))
+    return len(inputs)
+
+
+CALIBRATION = list(range(500))
+
+
+STAGES = {
+    'encode': run_encode,
+    'decode': run_decode,
+    'state': run_state,
+    'discovery': run_discovery,
+}
+
+
+def best_rate(function, inputs: list, seconds: float) -> float:
+    """
+    :param function:
+    :param inputs:
+    :param seconds: time spent on the passes
+    :return: frames/s of the fastest pass
+    """
+    frames = function(inputs, [])
+    best = 0.0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        function(inputs, [])
+        best = max(best, frames / (time.perf_counter() - start))
+    return best
+
+
+def measure(function, inputs: list, seconds: float) -> dict:
+    """
+    each stage is timed between two calibration runs, the faster of those is its reference
+    :param function:
+    :param inputs:
+    :param seconds: time spent on the speed measurement
+    :return: ops: frames/s, best of the passes; relative: ops over the calibration loop;
+        blocks & bytes: allocations still held per frame; peak: bytes per frame
+    """
+    frames = function(inputs, [])
+    calibration = best_rate(run_calibration, CALIBRATION, seconds / 4)
+    best = best_rate(function, inputs, seconds)
+    calibration = max(calibration, best_rate(run_calibration, CALIBRATION, seconds / 4))
+
+    # the outputs are kept so their allocations show up in the snapshot
+    keep = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    function(inputs, keep)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    size = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+
+    return {
+        'frames': frames,
+        'ops': best,
+        'relative': best / calibration,
+        'blocks': blocks / frames,
+        'bytes': size / frames,
+        'peak': (peak - base) / frames,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    ok = True
+    for stage, result in results.items():
+        line = (f'{stage:>10}: {result["ops"]:12,.0f} frames/s, {result["blocks"]:5.1f} blocks/frame,'
+                f' {result["bytes"]:7.1f} B/frame, peak {result["peak"]:7.1f} B/frame')
+        reference = baseline.get(stage)
+        if reference is not None:
+            speed = result['relative'] / reference['relative']
+            slower = speed < 1 - tolerance
+            # allocations do not depend on the machine, allow a block for interpreter noise
+            heavier = result['blocks'] > reference['blocks'] * (1 + tolerance) + 1
+            line += f'  | {speed:5.2f}x speed, {result["blocks"] - reference["blocks"]:+5.1f} blocks'
+            if slower or heavier:
+                line += '  REGRESSION'
+                ok = False
+        print(line)
+
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='replay benchmark of the protocol hot path')
+    parser.add_argument('--capture', default=SAMPLE)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='share a stage may lose before it fails')
+    parser.add_argument('--seconds', type=float, default=1.0, help='speed measurement per stage')
+    args = parser.parse_args()
+
+    inputs = prepare(load(args.capture))
+    results = {stage: measure(function, inputs[stage], args.seconds) for stage, function in STAGES.items()}
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    ok = compare(results, baseline, args.tolerance)
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            # raw frames/s only hold on this machine, they are not stored
+            json.dump({stage: {key: round(value, 3 if 'relative' == key else 1) for key, value in result.items()
+                               if 'ops' != key}
+                       for stage, result in results.items()}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'baseline saved to {args.baseline}')
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+in-process CozyLife devices: tcp server on 5555 and udp responder on 6095 for each, speaking cmd 0/2/3/10
+every device listens on its own loopback address (127.1.x.y), which linux routes to lo without setup
+python benchmarks/simulator.py [devices] [--latency MS] [--jitter MS] [--fragment RATE] [--drop RATE] [--report S]
+    [--ack echo|nack|silent|report_first]
+also the fake device of tests/ and bench_control_many.py
+prints 'ready <count>' once every device listens, then serves until interrupted
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import sys
+import time
+
+TCP_PORT = 5555
+UDP_PORT = 6095
+# dpid of a color bulb, see const.LIGHT_DPID
+LIGHT_ATTR = [1, 2, 3, 4, 5, 6]
+SWITCH_ATTR = [1]
+
+
+def device_ip(index: int) -> str:
+    return f'127.1.{index // 250}.{index % 250 + 1}'
+
+
+# how a device answers CMD_SET
+ACK_ECHO = 'echo'
+# res 1, the set is not taken
+ACK_NACK = 'nack'
+# no answer, the set is not taken
+ACK_SILENT = 'silent'
+# a cmd=10 report of the old state, then the ack
+ACK_REPORT_FIRST = 'report_first'
+
+
+def frame(cmd: int, sn: str, msg: dict, res: int = 0) -> bytes:
+    return json.dumps({'cmd': cmd, 'pv': 0, 'sn': sn, 'msg': msg, 'res': res}, separators=(',', ':')).encode() \
+        + b'\r\n'
+
+
+class SimulatedDevice(object):
+    """
+    one device, the answers follow the tcp_client docstring
+    latency: seconds before every answer, plus up to jitter
+    fragment: share of the answers written in random pieces
+    drop: share of the requests never answered
+    report_interval: seconds between unsolicited cmd=10 reports, None for none
+    ack: ACK_ECHO, ACK_NACK, ACK_SILENT or ACK_REPORT_FIRST
+    sets: msg.data of every CMD_SET received, set_at: perf_counter() when the last one came
+    """
+
+    def __init__(self, index: int, pid: str = 'e2s64v', type_code: str = '01', latency: float = 0.0,
+                 jitter: float = 0.0, fragment: float = 0.0, drop: float = 0.0,
+                 report_interval: float = None, seed: int = 0, ack: str = ACK_ECHO):
+        self.ip = device_ip(index)
+        # tcp port once started
+        self.port = None
+        self.did = f'{0x629168597cb94c4c1d8f + index:020x}'
+        self.pid = pid
+        self.type_code = type_code
+        self.attr = LIGHT_ATTR if '01' == type_code else SWITCH_ATTR
+        self.state = {'1': 0, '2': 0, '3': 500, '4': 1000, '5': 65535, '6': 65535} if '01' == type_code \
+            else {'1': 0}
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.drop = drop
+        self.report_interval = report_interval
+        self.ack = ack
+        self.sets = []
+        self.set_at = None
+        self.requests = 0
+        self.dropped = 0
+        self._random = random.Random(seed + index)
+        self._report_sn = 1636463611798
+        self._server = None
+        self._udp = None
+        # writer -> lock held while a frame is written, answers and reports share the connection
+        self._writers = {}
+        self._tasks = set()
+        # _handle of every open connection, they end once their writer is closed
+        self._connections = set()
+
+    def info(self) -> dict:
+        return {'did': self.did, 'dtp': '02', 'pid': self.pid, 'mac': self.did[-12:], 'ip': self.ip,
+                'rssi': -33, 'sv': '1.0.0', 'hv': '0.0.1'}
+
+    def answer(self, request: dict) -> list:
+        """
+        frames to send for a request
+        :param request:
+        :return:
+        """
+        cmd = request.get('cmd')
+        sn = request.get('sn')
+        if 0 == cmd:
+            return [frame(0, sn, self.info())]
+
+        if 2 == cmd:
+            return [frame(2, sn, {'attr': self.attr, 'data': dict(self.state)})]
+
+        if 3 == cmd:
+            data = {key: value for key, value in request.get('msg', {}).get('data', {}).items() if key in self.state}
+            if ACK_SILENT == self.ack:
+                return []
+            msg = {'attr': [int(key) for key in data], 'data': data}
+            if ACK_NACK == self.ack:
+                return [frame(3, sn, msg, res=1)]
+            old = self.report() if ACK_REPORT_FIRST == self.ack else None
+            self.state.update(data)
+            if old is not None:
+                return [old, frame(3, sn, msg)]
+            return [frame(3, sn, msg), self.report()]
+
+        return []
+
+    def report(self) -> bytes:
+        self._report_sn += 1
+        return frame(10, str(self._report_sn), {'attr': self.attr, 'data': dict(self.state)})
+
+    async def start(self, tcp_port: int = TCP_PORT) -> None:
+        loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.ip, tcp_port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.ip, 0))
+        self._udp, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, sock=sock)
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for writer in list(self._writers):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._udp is not None:
+            self._udp.close()
+
+    def discovery(self, addr) -> None:
+        """
+        answer a broadcast from its sender, through this device's own address
+        :param addr:
+        :return:
+        """
+        if self._lost():
+            return
+        self._spawn(self._reply_datagram(addr))
+
+    async def _reply_datagram(self, addr) -> None:
+        await self._wait()
+        self._udp.sendto(frame(0, '0', self.info()), addr)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _lost(self) -> bool:
+        self.requests += 1
+        if self.drop and self._random.random() < self.drop:
+            self.dropped += 1
+            return True
+        return False
+
+    async def _wait(self) -> None:
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _write(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        # a report must not land between the pieces of an answer
+        async with self._writers[writer]:
+            if not self.fragment or self._random.random() >= self.fragment:
+                writer.write(data)
+                return
+
+            i = 0
+            while i < len(data):
+                size = self._random.randrange(1, 16)
+                writer.write(data[i:i + size])
+                await writer.drain()
+                # give the reader a chance to see a partial frame
+                await asyncio.sleep(0)
+                i += size
+
+    async def _respond(self, writer: asyncio.StreamWriter, request: dict) -> None:
+        await self._wait()
+        for data in self.answer(request):
+            await self._write(writer, data)
+
+    async def _reports(self, writer: asyncio.StreamWriter) -> None:
+        while True:
+            await asyncio.sleep(self._random.uniform(0.5, 1.5) * self.report_interval)
+            await self._write(writer, self.report())
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers[writer] = asyncio.Lock()
+        task = asyncio.current_task()
+        self._connections.add(task)
+        reports = None
+        if self.report_interval:
+            reports = self._spawn(self._reports(writer))
+        try:
+            while True:
+                line = await reader.readuntil(b'\r\n')
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                if self._lost():
+                    continue
+                if 3 == request.get('cmd'):
+                    self.set_at = time.perf_counter()
+                    self.sets.append(request.get('msg', {}).get('data', {}))
+                # answers are written in order, the device handles one request at a time
+                await self._respond(writer, request)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if reports is not None:
+                reports.cancel()
+            self._writers.pop(writer, None)
+            self._connections.discard(task)
+            writer.close()
+
+
+class _Responder(asyncio.DatagramProtocol):
+
+    def __init__(self, simulator: 'Simulator'):
+        self._simulator = simulator
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            request = json.loads(data)
+        except ValueError:
+            return
+        if type(request) is dict and 0 == request.get('cmd'):
+            for device in self._simulator.devices:
+                device.discovery(addr)
+
+
+class Simulator(object):
+    """
+    many SimulatedDevice, one udp socket on udp_port takes the broadcasts for all of them
+    broadcast to 127.255.255.255 to reach it from the same host
+    """
+
+    def __init__(self, devices: list, tcp_port: int = TCP_PORT, udp_port: int = UDP_PORT):
+        self.devices = devices
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self._responder = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(device.start(self.tcp_port) for device in self.devices))
+        self._responder, _ = await loop.create_datagram_endpoint(
+            lambda: _Responder(self), local_addr=('0.0.0.0', self.udp_port), reuse_port=True)
+
+    async def stop(self) -> None:
+        if self._responder is not None:
+            self._responder.close()
+        await asyncio.gather(*(device.stop() for device in self.devices))
+
+
+def create_devices(count: int, switches: float = 0.2, **kwargs) -> list:
+    """
+    :param count:
+    :param switches: share of plugs among the bulbs
+    :param kwargs: SimulatedDevice options
+    :return:
+    """
+    rnd = random.Random(kwargs.get('seed', 0))
+    devices = []
+    for index in range(count):
+        if rnd.random() < switches:
+            devices.append(SimulatedDevice(index, pid='p93sfg', type_code='00', **kwargs))
+        else:
+            devices.append(SimulatedDevice(index, **kwargs))
+
+    return devices
+
+
+async def main(args) -> None:
+    simulator = Simulator(create_devices(args.devices, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                                         fragment=args.fragment, drop=args.drop, report_interval=args.report,
+                                         ack=args.ack),
+                          args.tcp_port, args.udp_port)
+    await simulator.start()
+    print(f'ready {len(simulator.devices)}', flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='simulated CozyLife devices')
+    parser.add_argument('devices', type=int, nargs='?', default=10)
+    parser.add_argument('--latency', type=float, default=5, help='ms before every answer')
+    parser.add_argument('--jitter', type=float, default=20, help='ms added at random to the latency')
+    parser.add_argument('--fragment', type=float, default=0.1, help='share of answers written in pieces')
+    parser.add_argument('--drop', type=float, default=0.0, help='share of requests never answered')
+    parser.add_argument('--report', type=float, default=None, help='seconds between cmd=10 reports')
+    parser.add_argument('--ack', default=ACK_ECHO, choices=[ACK_ECHO, ACK_NACK, ACK_SILENT, ACK_REPORT_FIRST],
+                        help='how CMD_SET is answered')
+    parser.add_argument('--tcp-port', type=int, default=TCP_PORT)
+    parser.add_argument('--udp-port', type=int, default=UDP_PORT)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
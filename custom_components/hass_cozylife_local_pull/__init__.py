@@ -1,55 +1,210 @@
 """Example Load Platform integration."""
 from __future__ import annotations
 
-from homeassistant.core import HomeAssistant
+from functools import partial
+import voluptuous as vol
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import Event, HomeAssistant, callback
+import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.typing import ConfigType
 import logging
-import time
 from .const import (
     DOMAIN,
-    LANG
+    LANG,
+    SIGNAL_DEVICE_READY,
 )
-from .utils import get_pid_list
-from .udp_discover import get_ip
-from .tcp_client import tcp_client
+from .udp_discover import EVENT_DISAPPEAR, DiscoveryService
+from .async_tcp_client import async_tcp_client
+from .channel import channels_of
+from .registry import DeviceRegistry
+from .catalogue import CHECK_INTERVAL, ProductCatalogue
+from .diagnostics import async_dump_diagnostics
+from .group import SET_MANY_SCHEMA, async_set_many
+from .reconnect import MAX_CONCURRENT_CONNECTS, ReconnectScheduler
+from .poll import MAX_RATE, POLL_INTERVAL, PollScheduler
+from .protocol import set_wire_sample
+from .effects import set_max_fps
 
 
 _LOGGER = logging.getLogger(__name__)
 
+# the options are read in async_setup and _async_connect_devices, 0 would divide by zero or block every connect
+CONFIG_SCHEMA = vol.Schema({
+    DOMAIN: vol.Schema({
+        vol.Optional('lang'): cv.string,
+        vol.Optional('ip'): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional('write_window'): vol.All(vol.Coerce(float), vol.Range(min=0, max=1000)),
+        vol.Optional('max_connects'): vol.All(vol.Coerce(int), vol.Range(min=1, max=256)),
+        vol.Optional('poll_interval'): vol.All(vol.Coerce(float), vol.Range(min=1, max=3600)),
+        vol.Optional('max_polls'): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=100)),
+        vol.Optional('transition_fps'): vol.All(vol.Coerce(float), vol.Range(min=1, max=50)),
+        vol.Optional('wire_sample'): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    }),
+}, extra=vol.ALLOW_EXTRA)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
 
-def setup(hass: HomeAssistant, config: ConfigType) -> bool:
-    
     """
-    TODO:timer discover
     config:{'lang': 'zh', 'ip': ['192.168.5.201', '192.168.5.202', '192.168.5.1']}
 }
+    discovery and connections run in the background, entities are added
+    by the platforms as soon as each device answered CMD_INFO
+    devices known from a previous run get their entity before the lan answers
     """
-    ip = get_ip()
-    ip_from_config = config[DOMAIN].get('ip') if config[DOMAIN].get('ip') is not None else []    
-    ip += ip_from_config
-    ip_list = []
-    [ip_list.append(i) for i in ip if i not in ip_list]
-
-    if 0 == len(ip_list):
-        _LOGGER.info('discover nothing')
-        return True
-
-    _LOGGER.info('try conncet ip_list:', ip_list)
-    lang_from_config = (config[DOMAIN].get('lang') if config[DOMAIN].get('lang') is not None else LANG)
-    get_pid_list(lang_from_config)
+    if config[DOMAIN].get('wire_sample') is not None:
+        set_wire_sample(config[DOMAIN]['wire_sample'])
+    if config[DOMAIN].get('transition_fps') is not None:
+        set_max_fps(config[DOMAIN]['transition_fps'])
 
+    registry = DeviceRegistry(hass)
+    await registry.async_load()
     hass.data[DOMAIN] = {
         'temperature': 24,
-        'ip': ip_list,
-        'tcp_client': [tcp_client(item) for item in ip_list],
+        'tcp_client': [],
+        # did -> client the entities were created for
+        'devices': {},
+        # did -> DeviceChannel of each entity of the device, sharing its client
+        'channels': {},
+        'registry': registry,
     }
 
-    #wait for get device info from tcp conncetion
-    #but it is bad
-    time.sleep(3)
-    # _LOGGER.info('setup', hass, config)
-    # hass.helpers.discovery.load_platform('sensor', DOMAIN, {}, config)
-    hass.loop.call_soon_threadsafe(hass.async_create_task, async_load_platform(hass, 'light', DOMAIN, {}, config))
-    hass.loop.call_soon_threadsafe(hass.async_create_task, async_load_platform(hass, 'switch', DOMAIN, {}, config))
+    async def async_stop(event: Event) -> None:
+        if hass.data[DOMAIN].get('catalogue_timer') is not None:
+            hass.data[DOMAIN]['catalogue_timer']()
+        if hass.data[DOMAIN].get('discovery') is not None:
+            await hass.data[DOMAIN]['discovery'].async_stop()
+        if hass.data[DOMAIN].get('poller') is not None:
+            await hass.data[DOMAIN]['poller'].async_stop()
+        for channels in hass.data[DOMAIN]['channels'].values():
+            for channel in channels:
+                await channel.async_stop()
+        for client in hass.data[DOMAIN]['tcp_client']:
+            await client.async_stop()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop)
+
+    hass.async_create_task(async_load_platform(hass, 'light', DOMAIN, {}, config))
+    hass.async_create_task(async_load_platform(hass, 'switch', DOMAIN, {}, config))
+    hass.async_create_task(async_load_platform(hass, 'sensor', DOMAIN, {}, config))
+    hass.services.async_register(DOMAIN, 'dump_diagnostics', partial(async_dump_diagnostics, hass))
+    hass.services.async_register(DOMAIN, 'set_many', partial(async_set_many, hass),
+                                 schema=SET_MANY_SCHEMA)
+    hass.async_create_task(_async_connect_devices(hass, config))
     return True
+
+
+async def _async_connect_devices(hass: HomeAssistant, config: ConfigType) -> None:
+    """
+    start the devices of the registry and of the config, then keep discovering new ones
+    one connection task per device
+    :param hass:
+    :param config:
+    :return:
+    """
+    registry = hass.data[DOMAIN]['registry']
+    lang_from_config = (config[DOMAIN].get('lang') if config[DOMAIN].get('lang') is not None else LANG)
+    catalogue = ProductCatalogue(hass, lang_from_config)
+    await catalogue.async_load()
+    if catalogue.loaded:
+        hass.async_create_task(catalogue.async_refresh())
+    hass.data[DOMAIN]['catalogue_timer'] = async_track_time_interval(hass, catalogue.async_refresh, CHECK_INTERVAL)
+
+    # ms, control() calls closer than this are merged into one frame
+    write_window = config[DOMAIN].get('write_window')
+    if write_window is not None:
+        write_window = write_window / 1000
+
+    # connects in flight across all devices, the rest wait their turn
+    max_connects = config[DOMAIN].get('max_connects')
+    scheduler = ReconnectScheduler(max_connects if max_connects is not None else MAX_CONCURRENT_CONNECTS)
+
+    # one poll task for all devices, spread and capped at max_polls queries per second
+    poll_interval = config[DOMAIN].get('poll_interval')
+    max_polls = config[DOMAIN].get('max_polls')
+    poller = PollScheduler(poll_interval if poll_interval is not None else POLL_INTERVAL,
+                           max_rate=max_polls if max_polls is not None else MAX_RATE)
+    hass.data[DOMAIN]['poller'] = poller
+    poller.start()
+
+    announced = hass.data[DOMAIN]['devices']
+    # did -> type code the device was announced with, None: announced again once the catalogue knows it
+    announced_type = {}
+
+    @callback
+    def device_info(client: async_tcp_client) -> None:
+        registry.async_update(client.record)
+        did = client.device_id
+        if did in announced and (announced_type[did] is not None or client.device_type_code is None):
+            return
+
+        announced[did] = client
+        announced_type[did] = client.device_type_code
+        hass.data[DOMAIN]['channels'][did] = channels_of(client)
+        async_dispatcher_send(hass, SIGNAL_DEVICE_READY, client)
+
+    @callback
+    def device_stale(client: async_tcp_client, info: dict) -> None:
+        # another device took the ip, its record loses the ip instead of its did
+        registry.async_stale(client.device_id)
+        if info['did'] in announced:
+            announced[info['did']].set_ip(client.ip)
+        elif not has_client(client.ip):
+            start_client(client.ip, registry.devices.get(info['did']), dict(info, ip=client.ip))
+
+    @callback
+    def connection_changed(client: async_tcp_client, changed: dict) -> None:
+        # a device that dropped off may be back at another ip, broadcast now instead of at the backoff
+        if not changed and not client.available and hass.data[DOMAIN].get('discovery') is not None:
+            hass.data[DOMAIN]['discovery'].trigger()
+
+    def start_client(ip: str, record: dict | None = None, info: dict | None = None) -> None:
+        client = async_tcp_client(ip, write_window, on_device_info=device_info, info=info, scheduler=scheduler,
+                                  poller=poller, on_stale=device_stale)
+        client.add_listener(partial(connection_changed, client))
+        hass.data[DOMAIN]['tcp_client'].append(client)
+        if record is not None:
+            client.restore(record)
+            device_info(client)
+        client.start()
+
+    def has_client(ip: str) -> bool:
+        return any(ip == item.ip and not item.stale for item in hass.data[DOMAIN]['tcp_client'])
+
+    for record in list(registry.devices.values()):
+        if record.get('ip') is not None and not has_client(record['ip']):
+            start_client(record['ip'], record)
+
+    if not catalogue.loaded:
+        # first run without a saved list, new devices need it for their type code
+        await catalogue.async_refresh()
+
+    ip_from_config = config[DOMAIN].get('ip') if config[DOMAIN].get('ip') is not None else []
+    for item in ip_from_config:
+        if not has_client(item):
+            start_client(item)
+
+    @callback
+    def discovery_event(event: str, record: dict) -> None:
+        # a device that went away is noticed by its own connection
+        if EVENT_DISAPPEAR == event:
+            return
+
+        # the reply carries the CMD_INFO fields, no tcp handshake needed
+        info = record if record['did'] is not None else None
+        if record['did'] in announced:
+            announced[record['did']].set_info(info)
+        elif not has_client(record['ip']):
+            start_client(record['ip'], info=info)
+        elif info is not None:
+            # the ip is held for another did, its client asks who answers there and device_stale takes over
+            for client in hass.data[DOMAIN]['tcp_client']:
+                if client.ip == info['ip'] and not client.stale and client.device_id not in (None, info['did']):
+                    client.reconnect()
+
+    discovery = DiscoveryService(discovery_event)
+    hass.data[DOMAIN]['discovery'] = discovery
+    await discovery.async_start()
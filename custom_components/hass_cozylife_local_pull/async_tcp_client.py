@@ -0,0 +1,793 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from collections import deque
+from typing import Callable, Optional
+import logging
+from .utils import get_pid_info, sn_generator
+from .protocol import CMD_INFO, CMD_QUERY, CMD_SET, FrameDecoder, Message, PacketEncoder, parse_info, \
+    wire_trace
+from .health import DeviceHealth
+from .reconnect import STABLE_AFTER, STATE_BACKOFF, STATE_CONNECTED, STATE_CONNECTING, ReconnectScheduler
+from .poll import PollScheduler
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class async_tcp_client(object):
+    """
+    Represents a device on the event loop, same protocol as tcp_client
+    one task per device owns the connection, reads every frame and reconnects when the scheduler allows
+    every frame carrying msg.data (query reply, set echo, cmd=10 report) updates the state cache
+    one client per device, the entities share it through channel.DeviceChannel, each listening to its own dpid
+    a device silent for _poll_interval seconds is queried once, whatever the number of entities
+    and dropped when that query stays unanswered for another interval
+    with a poller, the PollScheduler shared by all devices decides when to query and when to give up instead
+    requests are pipelined, each reply is routed to its waiter by sn
+    control() calls within _write_window seconds are merged by dpid into one CMD_SET, last value wins
+    control() values are in the state cache at once, until the ack of their CMD_SET confirms or overrides them
+    a refused set (res != 0) is rolled back, reports sent before the device took the set leave it alone
+    a dpid the device did not report within _verify_delay seconds is queried, and rolled back if that fails
+    """
+    _port = 5555
+    _timeout = 3
+    _poll_interval = 30
+    _write_window = 0.05
+    _verify_delay = 2
+
+    def __init__(self, ip, write_window: Optional[float] = None,
+                 on_device_info: Optional[Callable[['async_tcp_client'], None]] = None,
+                 info: Optional[dict] = None, scheduler: Optional[ReconnectScheduler] = None,
+                 poller: Optional[PollScheduler] = None,
+                 on_stale: Optional[Callable[['async_tcp_client', dict], None]] = None):
+        self._ip = ip
+        # share one scheduler between clients to cap their concurrent connects
+        self._scheduler = scheduler if scheduler is not None else ReconnectScheduler()
+        self._poller = poller
+        self._reconnect_state = STATE_CONNECTING
+        # failed attempts in a row
+        self._reconnect_attempts = 0
+        # loop time of the next attempt while in STATE_BACKOFF
+        self._next_attempt = None
+        self._health = DeviceHealth()
+        # discovery record (protocol.parse_info) of this ip, replaces the CMD_INFO handshake of the next connect
+        self._info = info
+        # called every time the device info was (re)applied
+        self._on_device_info = on_device_info
+        # called with the info of the other device found at this ip
+        self._on_stale = on_stale
+        # another device answers at this ip, no connect until set_ip moves it
+        self._stale = False
+        if write_window is not None:
+            self._write_window = write_window
+        self._reader = None
+        self._writer = None
+        self._task = None
+        # set to skip the wait before the next connect
+        self._reconnect_now = asyncio.Event()
+        self._decoder = FrameDecoder()
+        # decoded frames not consumed yet
+        self._frames = deque()
+        self._sn_generator = sn_generator()
+        self._encoder = PacketEncoder()
+        # sn -> future of every request waiting for its reply
+        self._inflight = {}
+        # dpid -> value of control() calls waiting for the next CMD_SET
+        self._pending_writes = {}
+        self._pending_wait = False
+        # seconds the waiting callers give the device to ack, None: _timeout
+        self._pending_timeout = None
+        self._flush_task = None
+        self._writes_sent = 0
+        self._writes_merged = 0
+        self._writes_dropped = 0
+        self._writes_rolled_back = 0
+        # dpid -> sn of the CMD_SET carrying the optimistic value, None until sent
+        self._optimistic = {}
+        # dpid -> value before the first unconfirmed control()
+        self._confirmed = {}
+        self._verify_task = None
+        # dpid -> value, fed by every frame the device sends
+        self._state = {}
+        # every listener, told when available flips
+        self._listeners = []
+        # listeners of any dpid
+        self._all_dpid = []
+        # dpid -> listeners of that dpid only
+        self._subscriptions = {}
+
+        self._device_id = None
+        self._pid = None
+        self._device_type_code = None
+        self._icon = None
+        self._device_model_name = None
+        self._dpid = []
+
+    @property
+    def ip(self) -> str:
+        return self._ip
+
+    @property
+    def pid(self):
+        return self._pid
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    @property
+    def stale(self) -> bool:
+        return self._stale
+
+    @property
+    def available(self) -> bool:
+        """
+        connected and device info applied
+        :return:
+        """
+        return STATE_CONNECTED == self._reconnect_state
+
+    @property
+    def health(self) -> DeviceHealth:
+        return self._health
+
+    @property
+    def reconnect_state(self) -> dict:
+        """
+        state: connecting, connected or backoff
+        attempts: failed attempts in a row
+        next_attempt: seconds until the next attempt in backoff
+        :return:
+        """
+        next_attempt = None
+        if STATE_BACKOFF == self._reconnect_state and self._next_attempt is not None:
+            next_attempt = max(0.0, self._next_attempt - asyncio.get_running_loop().time())
+
+        return {
+            'state': self._reconnect_state,
+            'attempts': self._reconnect_attempts,
+            'next_attempt': next_attempt,
+        }
+
+    @property
+    def state(self) -> dict:
+        """
+        last known value of every dpid, do not modify
+        :return:
+        """
+        return self._state
+
+    @property
+    def write_counters(self) -> dict:
+        """
+        sent: CMD_SET frames written
+        merged: control() calls folded into an already pending frame
+        dropped: dpid values overwritten before they were sent
+        rolled_back: optimistic dpid values the device overrode or never confirmed
+        :return:
+        """
+        return {
+            'sent': self._writes_sent,
+            'merged': self._writes_merged,
+            'dropped': self._writes_dropped,
+            'rolled_back': self._writes_rolled_back,
+        }
+
+    @property
+    def dpid(self):
+        return self._dpid
+
+    @property
+    def device_model_name(self):
+        return self._device_model_name
+
+    @property
+    def icon(self):
+        return self._icon
+
+    @property
+    def device_type_code(self) -> str:
+        return self._device_type_code
+
+    @property
+    def device_id(self):
+        return self._device_id
+
+    @property
+    def record(self) -> dict:
+        """
+        device info to persist, see restore
+        :return:
+        """
+        return {
+            'did': self._device_id,
+            'pid': self._pid,
+            'ip': self._ip,
+            'type_code': self._device_type_code,
+            'model_name': self._device_model_name,
+            'icon': self._icon,
+            'dpid': self._dpid,
+        }
+
+    def restore(self, record: dict) -> None:
+        """
+        fill device info from a stored record, CMD_INFO still runs on connect and overrides it
+        :param record:
+        :return:
+        """
+        self._device_id = record.get('did')
+        self._pid = record.get('pid')
+        self._device_type_code = record.get('type_code')
+        self._device_model_name = record.get('model_name')
+        self._icon = record.get('icon')
+        self._dpid = record.get('dpid') or []
+
+    def add_listener(self, listener: Callable[[dict], None], dpids: Optional[list] = None) -> Callable[[], None]:
+        """
+        call listener with the changed dpid when the state cache changes
+        :param listener:
+        :param dpids: only these dpid, listener gets the changed ones among them; default any dpid
+        :return: remove listener
+        """
+        self._listeners.append(listener)
+        if dpids is None:
+            self._all_dpid.append(listener)
+        else:
+            for key in dpids:
+                self._subscriptions.setdefault(key, []).append(listener)
+
+        def remove_listener() -> None:
+            if listener not in self._listeners:
+                return
+            self._listeners.remove(listener)
+            if dpids is None:
+                self._all_dpid.remove(listener)
+                return
+            for key in dpids:
+                listeners = self._subscriptions[key]
+                listeners.remove(listener)
+                if not listeners:
+                    del self._subscriptions[key]
+
+        return remove_listener
+
+    def _set_reconnect_state(self, state: str) -> None:
+        """
+        listeners are called with no changed dpid when available flips
+        :param state:
+        :return:
+        """
+        was_available = self.available
+        self._reconnect_state = state
+        if was_available != self.available:
+            self._notify({})
+
+    def _notify(self, changed: dict) -> None:
+        """
+        one pass over the changed dpid collects what each listener subscribed to, every listener is called once
+        :param changed: dpid -> value, empty when available flipped: every listener is called
+        :return:
+        """
+        if not changed:
+            calls = [(listener, changed) for listener in self._listeners]
+        else:
+            calls = [(listener, changed) for listener in self._all_dpid]
+            if self._subscriptions:
+                batches = {}
+                for key, value in changed.items():
+                    for listener in self._subscriptions.get(key, ()):
+                        batch = batches.get(listener)
+                        if batch is None:
+                            batch = batches[listener] = {}
+                        batch[key] = value
+                calls += batches.items()
+
+        for listener, data in calls:
+            try:
+                listener(data)
+            except Exception:
+                _LOGGER.exception('state listener error')
+
+    def _update_state(self, data: dict) -> None:
+        """
+        merge data into the state cache and notify listeners
+        :param data:
+        :return:
+        """
+        changed = {}
+        for key, value in data.items():
+            if self._state.get(key) != value:
+                changed[key] = value
+
+        if not changed:
+            return
+
+        self._state.update(changed)
+        if self._poller is not None:
+            self._poller.touch(self)
+        self._notify(changed)
+
+    def _reconcile(self, message: Message) -> dict:
+        """
+        an optimistic dpid is settled by the ack of its own CMD_SET only, or by _verify_writes
+        reports and other replies may predate the set, they leave it alone
+        :param message: frame carrying data, res 0
+        :return: data without the optimistic dpid it does not settle
+        """
+        if not self._optimistic:
+            return message.data
+
+        result = {}
+        for key, value in message.data.items():
+            if key in self._optimistic:
+                if message.sn != self._optimistic[key]:
+                    continue
+                del self._optimistic[key]
+                self._confirmed.pop(key, None)
+                if self._state.get(key) != value:
+                    # acked with another value than the one set
+                    self._writes_rolled_back += 1
+            result[key] = value
+
+        return result
+
+    def _nacked(self, message: Message) -> None:
+        """
+        the device refused a CMD_SET, roll back the dpid still waiting for it
+        :param message: frame with res != 0
+        :return:
+        """
+        if message.sn is not None and message.sn in self._optimistic.values():
+            _LOGGER.debug('%s set refused: res=%s sn=%s', self._ip, message.res, message.sn)
+            self._roll_back_set(list(self._optimistic), message.sn)
+
+    def _roll_back_set(self, keys, sn: Optional[str] = None) -> None:
+        """
+        roll back the dpid of keys still waiting for the CMD_SET sn, set again since are left alone
+        :param keys:
+        :param sn: None when the frame never went out
+        :return:
+        """
+        self._roll_back([key for key in keys if key in self._optimistic and sn == self._optimistic[key]])
+
+    def _roll_back(self, keys) -> None:
+        """
+        restore the confirmed value of optimistic dpid the device did not take
+        :param keys:
+        :return:
+        """
+        changed = {}
+        for key in keys:
+            if key not in self._optimistic:
+                continue
+            del self._optimistic[key]
+            value = self._confirmed.pop(key, None)
+            if value is None:
+                self._state.pop(key, None)
+            else:
+                self._state[key] = value
+            changed[key] = value
+
+        if changed:
+            self._writes_rolled_back += len(changed)
+            _LOGGER.debug('%s rolled back %s', self._ip, changed)
+            self._notify(changed)
+
+    async def _verify_writes(self) -> None:
+        """
+        query the optimistic dpid the device kept quiet about, roll them back without an answer
+        :return:
+        """
+        while self._optimistic:
+            await asyncio.sleep(self._verify_delay)
+            # only the sets out before the query are settled by its reply
+            sent = {key: sn for key, sn in self._optimistic.items() if sn is not None}
+            if not sent:
+                if self._flush_task is None:
+                    # never sent and no frame coming for them
+                    self._roll_back([key for key, sn in self._optimistic.items() if sn is None])
+                continue
+
+            data = await self.async_query()
+            # dpid set again meanwhile wait for the next round
+            unchanged = [key for key, sn in sent.items() if self._optimistic.get(key) == sn]
+            if not data:
+                self._roll_back(unchanged)
+                continue
+
+            settled = {}
+            for key in unchanged:
+                del self._optimistic[key]
+                self._confirmed.pop(key, None)
+                # not a dpid the device reports: keep the value
+                if key in data:
+                    if self._state.get(key) != data[key]:
+                        self._writes_rolled_back += 1
+                    settled[key] = data[key]
+            self._update_state(settled)
+
+        self._verify_task = None
+
+    def start(self) -> None:
+        """
+        start the connection task, must be called from the event loop
+        :return:
+        """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def set_info(self, info: dict) -> None:
+        """
+        discovery saw the device, use its record on the next connect
+        a record of the ip it is connected to says nothing new, the next connect asks the device again
+        :param info: protocol.parse_info record, ip is where the reply came from
+        :return:
+        """
+        if info['ip'] == self._ip and self.available:
+            return
+
+        self._info = info
+        self.set_ip(info['ip'])
+
+    def set_ip(self, ip: str) -> None:
+        """
+        the device moved, drop the connection and connect to the new ip now
+        :param ip:
+        :return:
+        """
+        if ip == self._ip:
+            return
+
+        _LOGGER.info('%s ip %s -> %s', self._device_id, self._ip, ip)
+        self._ip = ip
+        self._stale = False
+        self._reconnect_attempts = 0
+        self.reconnect()
+
+    def reconnect(self) -> None:
+        """
+        close the connection if any and connect again without waiting
+        :return:
+        """
+        self._reconnect_now.set()
+        if self._writer is not None:
+            # the read loop sees eof and falls through to the reconnect
+            self._writer.close()
+
+    async def async_stop(self) -> None:
+        """
+        stop the connection task and close the socket
+        :return:
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # no control() gets through once the connection is closed, nothing starts them again
+        tasks = [task for task in (self._flush_task, self._verify_task) if task is not None]
+        self._flush_task = None
+        self._verify_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._close_connection()
+
+    def _close_connection(self) -> None:
+        if self._poller is not None:
+            self._poller.remove(self)
+
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception as e:
+                _LOGGER.warning('%s error while closing the connection: %s', self._ip, e)
+
+        self._reader = None
+        self._writer = None
+
+        for future in self._inflight.values():
+            if not future.done():
+                future.set_exception(ConnectionError('connection closed'))
+        self._inflight.clear()
+
+    async def _run(self) -> None:
+        """
+        connect, get device info, then read until the connection drops
+        this task is the only pending attempt of the device
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._stale:
+                # the next set_ip tells where the device went
+                await self._reconnect_now.wait()
+                self._reconnect_now.clear()
+                continue
+
+            self._set_reconnect_state(STATE_CONNECTING)
+            connected_at = None
+            try:
+                async with self._scheduler:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self._ip, self._port), self._timeout)
+                    self._decoder.reset()
+                    self._frames.clear()
+                    self._sn_generator = sn_generator()
+                    # a record is good for one connect, another device may hold the ip by the next one
+                    info, self._info = self._info, None
+                    if info is not None and info['ip'] == self._ip:
+                        self._apply_info(info)
+                    else:
+                        await self._device_info()
+
+                connected_at = loop.time()
+                self._health.connects += 1
+                self._set_reconnect_state(STATE_CONNECTED)
+                # fill the state cache, the reply is picked up by _read_loop
+                self._send(CMD_QUERY, {})
+                if self._poller is not None:
+                    self._poller.add(self)
+                await self._read_loop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # first failure of a series at info, the retries at debug
+                _LOGGER.log(logging.DEBUG if self._reconnect_attempts else logging.INFO,
+                            '%s connection failed: %r', self._ip, e)
+                if connected_at is None:
+                    self._health.connect_failures += 1
+                else:
+                    self._health.disconnects += 1
+
+            self._close_connection()
+            # a connection that held up starts over, a flapping one keeps backing off
+            if connected_at is not None and loop.time() - connected_at > STABLE_AFTER:
+                self._reconnect_attempts = 0
+
+            delay = self._scheduler.delay(self._reconnect_attempts)
+            self._reconnect_attempts += 1
+            self._next_attempt = loop.time() + delay
+            self._set_reconnect_state(STATE_BACKOFF)
+            try:
+                await asyncio.wait_for(self._reconnect_now.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._reconnect_now.clear()
+            self._next_attempt = None
+
+    async def _read_frame(self) -> Message:
+        """
+        next whole frame from the stream, frames may span or share reads
+        :return:
+        """
+        while not self._frames:
+            data = await self._reader.read(4096)
+            if not data:
+                raise ConnectionError('connection closed by device')
+            self._health.seen(len(data))
+            wire_trace('<', self._ip, data)
+            self._frames.extend(self._decoder.feed(data))
+
+        self._health.frames_in += 1
+        return self._frames.popleft()
+
+    async def _device_info(self) -> None:
+        """
+        get info for device model
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        sn = self._send(CMD_INFO, {})
+        deadline = loop.time() + self._timeout
+        while True:
+            message = await asyncio.wait_for(self._read_frame(), max(0.0, deadline - loop.time()))
+            # a report sent before the request may come first
+            if sn == message.sn:
+                break
+        info = parse_info(message)
+        if info is None:
+            raise ValueError(f'_device_info.recv.error: {message}')
+
+        self._apply_info(info)
+
+    def _apply_info(self, info: dict) -> None:
+        """
+        set device model from a CMD_INFO or discovery record
+        a device known by another did is not renamed, the connection is dropped and the client left stale
+        :param info:
+        :return:
+        """
+        if self._device_id is not None and info['did'] != self._device_id:
+            _LOGGER.warning('%s answers as %s, not %s', self._ip, info['did'], self._device_id)
+            self._stale = True
+            if self._on_stale is not None:
+                self._on_stale(self, info)
+            raise ConnectionError(f'{self._ip} is {info["did"]} now')
+
+        self._device_id = info['did']
+        self._pid = info['pid']
+        model = get_pid_info(self._pid)
+        if model:
+            self._icon = model['i']
+            self._device_model_name = model['n']
+            self._dpid = model['dpid']
+            self._device_type_code = model['c']
+
+        _LOGGER.debug('%s device_id=%s,pid=%s,type_code=%s,model=%s', self._ip, self._device_id, self._pid,
+                      self._device_type_code, self._device_model_name)
+
+        if self._on_device_info is not None:
+            self._on_device_info(self)
+
+    async def _read_loop(self) -> None:
+        """
+        read frames into the state cache, replies are routed to their waiter by sn
+        :return:
+        """
+        # the poller queries and drops a silent device itself
+        timeout = self._poll_interval if self._poller is None else None
+        polled = False
+        while True:
+            try:
+                message = await asyncio.wait_for(self._read_frame(), timeout)
+            except asyncio.TimeoutError:
+                if polled:
+                    self._health.timeouts += 1
+                    raise ConnectionError('no answer to the poll')
+                # nothing pushed for a whole interval, poll; the reply comes back through here
+                self._send(CMD_QUERY, {})
+                polled = True
+                continue
+
+            polled = False
+
+            if message.res:
+                self._nacked(message)
+            elif message.data is not None:
+                self._update_state(self._reconcile(message))
+
+            future = self._inflight.pop(message.sn, None)
+            if future is not None and not future.done():
+                future.set_result(message)
+
+    def _send(self, cmd: int, payload: dict) -> str:
+        """
+        send but not receiver
+        :param cmd:
+        :param payload:
+        :return: sn of the message
+        """
+        sn = next(self._sn_generator)
+        package = self._encoder.encode(cmd, sn, payload)
+        self._writer.write(package)
+        if CMD_SET == cmd:
+            for key in payload:
+                if key in self._optimistic:
+                    self._optimistic[key] = sn
+        self._health.sent(len(package))
+        wire_trace('>', self._ip, package)
+        return sn
+
+    async def _send_receiver(self, cmd: int, payload: dict, timeout: Optional[float] = None) -> Optional[Message]:
+        """
+        send & receiver, any number of requests may be in flight
+        :param cmd:
+        :param payload:
+        :param timeout: seconds to wait for this reply, default _timeout
+        :return: reply or None
+        """
+        if not self.connected:
+            return None
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            sn = self._send(cmd, payload)
+        except Exception as e:
+            _LOGGER.debug('%s _send_receiver.send.error: %r', self._ip, e)
+            if CMD_SET == cmd:
+                self._roll_back_set(payload)
+            return None
+
+        self._inflight[sn] = future
+        sent_at = loop.time()
+        try:
+            reply = await asyncio.wait_for(future, self._timeout if timeout is None else timeout)
+            self._health.rtt(loop.time() - sent_at)
+            return reply
+        except asyncio.TimeoutError:
+            self._health.timeouts += 1
+            _LOGGER.debug('%s _send_receiver.recv.timeout: sn=%s', self._ip, sn)
+        except OSError as e:
+            _LOGGER.debug('%s _send_receiver.recv.error: sn=%s %r', self._ip, sn, e)
+        finally:
+            self._inflight.pop(sn, None)
+
+        if CMD_SET == cmd:
+            self._roll_back_set(payload, sn)
+        return None
+
+    async def _flush_writes(self) -> bool:
+        """
+        send the merged control() payloads once the write window closes
+        :return:
+        """
+        await asyncio.sleep(self._write_window)
+        payload, self._pending_writes = self._pending_writes, {}
+        wait, self._pending_wait = self._pending_wait, False
+        timeout, self._pending_timeout = self._pending_timeout, None
+        self._flush_task = None
+
+        if not self.connected:
+            self._roll_back(payload.keys())
+            return False
+
+        self._writes_sent += 1
+        if wait:
+            # a refused or lost set is rolled back by _read_loop or _send_receiver
+            reply = await self._send_receiver(CMD_SET, payload, timeout)
+            return reply is not None and 0 == reply.res
+
+        sn = None
+        try:
+            sn = self._send(CMD_SET, payload)
+            await self._writer.drain()
+        except Exception as e:
+            _LOGGER.debug('%s async_control.send.error: %r', self._ip, e)
+            self._roll_back_set(payload, sn)
+            return False
+
+        return True
+
+    async def async_control(self, payload: dict, wait: bool = False, timeout: Optional[float] = None) -> bool:
+        """
+        control use dpid, merged with the other calls of the same write window
+        the state cache and listeners see the values at once
+        :param payload:
+        :param wait: wait for the device to ack the set
+        :param timeout: seconds to wait for the ack, default _timeout; the longest of a window applies
+        :return:
+        """
+        if not self.connected:
+            return False
+
+        for key, value in payload.items():
+            if key not in self._optimistic:
+                self._confirmed[key] = self._state.get(key)
+            self._optimistic[key] = None
+        self._update_state(payload)
+        if self._verify_task is None:
+            self._verify_task = asyncio.get_running_loop().create_task(self._verify_writes())
+
+        if self._pending_writes:
+            self._writes_merged += 1
+
+        for key, value in payload.items():
+            if key in self._pending_writes:
+                self._writes_dropped += 1
+            self._pending_writes[key] = value
+
+        self._pending_wait = self._pending_wait or wait
+        if wait and timeout is not None:
+            self._pending_timeout = max(timeout, self._pending_timeout or 0)
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_writes())
+
+        # shield: a cancelled caller must not cancel the frame of the others
+        return await asyncio.shield(self._flush_task)
+
+    async def async_query(self, timeout: Optional[float] = None) -> dict:
+        """
+        query device state
+        :param timeout:
+        :return:
+        """
+        reply = await self._send_receiver(CMD_QUERY, {}, timeout)
+        if reply is None or reply.data is None:
+            return {}
+
+        return reply.data
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import logging
+import time
+from datetime import timedelta
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN, LANG
+from .utils import fetch_pid_list, set_pid_list
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = f'{DOMAIN}.pid_list'
+STORAGE_VERSION = 1
+# a list younger than this is not downloaded again, older ones are revalidated with their etag
+CATALOGUE_TTL = timedelta(days=1)
+# how often the age is checked, a tick of CATALOGUE_TTL would find the list a little too young every other time
+CHECK_INTERVAL = timedelta(hours=1)
+
+"""
+product catalogue (get_pid_list) kept in .storage, so startup works without internet
+"""
+
+
+class ProductCatalogue(object):
+
+    def __init__(self, hass: HomeAssistant, lang: str = LANG):
+        self._hass = hass
+        self._lang = lang
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._etag = None
+        self._fetched_at = 0
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    async def async_load(self) -> None:
+        """
+        index the list saved by a previous run
+        :return:
+        """
+        data = await self._store.async_load()
+        if data is None or type(data.get('list')) is not list:
+            return
+
+        set_pid_list(data['list'])
+        self._loaded = True
+        # a list of another language has to be downloaded again
+        if data.get('lang') == self._lang:
+            self._etag = data.get('etag')
+            self._fetched_at = data.get('fetched_at', 0)
+
+    async def async_refresh(self, *args) -> None:
+        """
+        download the list when it is older than CATALOGUE_TTL, keep the current one on error
+        :return:
+        """
+        if time.time() - self._fetched_at < CATALOGUE_TTL.total_seconds():
+            return
+
+        pid_list, etag = await self._hass.async_add_executor_job(fetch_pid_list, self._lang, self._etag)
+        if pid_list is None:
+            if etag is not None:
+                # not modified, check again after the next ttl
+                self._fetched_at = time.time()
+            return
+
+        set_pid_list(pid_list)
+        self._loaded = True
+        self._etag = etag
+        self._fetched_at = time.time()
+        await self._store.async_save({
+            'lang': self._lang,
+            'etag': self._etag,
+            'fetched_at': self._fetched_at,
+            'list': pid_list,
+        })
+        _LOGGER.info('pid list refreshed, %d categories', len(pid_list))
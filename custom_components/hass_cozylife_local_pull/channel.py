@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+from typing import Callable, Optional
+from .const import (
+    LIGHT_DPID,
+    LIGHT_TYPE_CODE,
+    SWITCH,
+    SWITCH_GANG_DPID,
+    SWITCH_TYPE_CODE,
+)
+from .async_tcp_client import async_tcp_client
+from .effects import EffectRunner
+
+"""
+entities over the shared connection of a device: one async_tcp_client per device, one channel per entity
+a channel sees the dpid of its entity only, a multi-gang switch has a channel per gang
+"""
+
+
+class DeviceChannel(object):
+    """
+    the part of a device one entity controls
+    dpid_map: entity dpid -> device dpid, e.g. gang 2 of a switch is SWITCH to the entity and '2' to the device
+    None for every dpid as is
+    """
+
+    def __init__(self, client: async_tcp_client, dpid_map: Optional[dict] = None,
+                 unique_id: Optional[str] = None, name: Optional[str] = None):
+        self._client = client
+        self._dpid_map = dpid_map
+        # device dpid -> entity dpid, None when nothing is renamed
+        self._reverse = None
+        if dpid_map is not None and any(key != value for key, value in dpid_map.items()):
+            self._reverse = {value: key for key, value in dpid_map.items()}
+        self._unique_id = unique_id
+        self._name = name
+        # transitions and effects of this channel, stopped by any other control
+        self.effects = EffectRunner(self._send_frame)
+
+    @property
+    def client(self) -> async_tcp_client:
+        return self._client
+
+    @property
+    def device_id(self):
+        return self._client.device_id
+
+    @property
+    def unique_id(self) -> str:
+        return self._unique_id if self._unique_id is not None else self._client.device_id
+
+    @property
+    def name(self) -> str:
+        if self._name is not None:
+            return self._name
+        return self._client.device_model_name + ' ' + self._client.device_id[-4:]
+
+    @property
+    def available(self) -> bool:
+        return self._client.available
+
+    @property
+    def dpid(self):
+        return self._client.dpid
+
+    @property
+    def device_dpid(self) -> Optional[list]:
+        """
+        dpid of the device this channel listens to, None for all
+        :return:
+        """
+        return None if self._dpid_map is None else list(self._dpid_map.values())
+
+    @property
+    def state(self) -> dict:
+        """
+        last known value of the dpid of this channel, in entity dpid
+        :return:
+        """
+        return self._to_entity(self._client.state)
+
+    def _to_entity(self, data: dict) -> dict:
+        if self._dpid_map is None:
+            return data
+        if self._reverse is None:
+            return {key: value for key, value in data.items() if key in self._dpid_map}
+        return {self._reverse[key]: value for key, value in data.items() if key in self._reverse}
+
+    def _to_device(self, payload: dict) -> dict:
+        if self._dpid_map is None:
+            return payload
+        return {self._dpid_map[key]: value for key, value in payload.items() if key in self._dpid_map}
+
+    def add_listener(self, listener: Callable[[dict], None]) -> Callable[[], None]:
+        """
+        call listener with the changed dpid of this channel, in entity dpid
+        :param listener:
+        :return: remove listener
+        """
+        if self._reverse is None:
+            return self._client.add_listener(listener, self.device_dpid)
+
+        reverse = self._reverse
+
+        def translate(changed: dict) -> None:
+            listener({reverse[key]: value for key, value in changed.items()})
+
+        return self._client.add_listener(translate, self.device_dpid)
+
+    async def _send_frame(self, payload: dict) -> None:
+        payload = self._to_device(payload)
+        if payload:
+            await self._client.async_control(payload)
+
+    async def async_control(self, payload: dict, wait: bool = False, timeout: Optional[float] = None) -> bool:
+        """
+        control in entity dpid, dpid outside the channel are left out
+        a transition or effect still running is stopped first
+        :param payload:
+        :param wait: wait for the device to ack the set
+        :param timeout: seconds to wait for the ack
+        :return:
+        """
+        self.effects.cancel()
+        payload = self._to_device(payload)
+        if not payload:
+            return False
+
+        return await self._client.async_control(payload, wait, timeout)
+
+    async def async_stop(self) -> None:
+        """
+        stop the transition or effect of this channel, the client is stopped by its owner
+        :return:
+        """
+        await self.effects.async_stop()
+
+    async def async_query(self, timeout: Optional[float] = None) -> dict:
+        """
+        query the device, one query answers every channel
+        :param timeout:
+        :return: the dpid of this channel, in entity dpid
+        """
+        return self._to_entity(await self._client.async_query(timeout))
+
+
+def channels_of(client: async_tcp_client) -> list:
+    """
+    the entities of a device
+    light: one channel over LIGHT_DPID
+    switch: one channel per gang of SWITCH_GANG_DPID the model lists, the first gang keeps the device unique_id
+    :param client: with device info applied
+    :return: list of DeviceChannel
+    """
+    if LIGHT_TYPE_CODE == client.device_type_code:
+        return [DeviceChannel(client, {key: key for key in LIGHT_DPID})]
+
+    if SWITCH_TYPE_CODE != client.device_type_code:
+        return []
+
+    model_dpid = [str(item) for item in client.dpid or []]
+    gangs = [key for key in SWITCH_GANG_DPID if key in model_dpid]
+    if len(gangs) < 2:
+        return [DeviceChannel(client, {SWITCH: SWITCH})]
+
+    name = client.device_model_name + ' ' + client.device_id[-4:]
+    channels = []
+    for i, key in enumerate(gangs):
+        unique_id = None if 0 == i else f'{client.device_id}_{key}'
+        channels.append(DeviceChannel(client, {SWITCH: key}, unique_id, f'{name} {i + 1}'))
+
+    return channels
@@ -1,4 +1,6 @@
 DOMAIN = "hass_cozylife_local_pull"
+# async_dispatcher signal, payload: async_tcp_client that answered CMD_INFO
+SIGNAL_DEVICE_READY = f"{DOMAIN}_device_ready"
 
 # http://doc.doit/project-5/doc-8/
 SWITCH_TYPE_CODE = '00'
@@ -15,5 +17,7 @@ SAT = '6'
 
 LIGHT_DPID = [SWITCH, WORK_MODE, TEMP, BRIGHT, HUE, SAT]
 SWITCH_DPID = [SWITCH, ]
+# on/off dpid of each gang of a multi-gang switch, in the order of the gangs
+SWITCH_GANG_DPID = ['1', '2', '3', '4']
 LANG = 'en'
 API_DOMAIN = 'api-us.doiting.com'
\ No newline at end of file
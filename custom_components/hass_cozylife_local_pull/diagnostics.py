@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import json
+import logging
+from homeassistant.core import HomeAssistant, ServiceCall
+from .const import DOMAIN
+from .state import to_states
+
+_LOGGER = logging.getLogger(__name__)
+
+DIAGNOSTICS_FILE = f'{DOMAIN}_diagnostics.json'
+
+"""
+dump of every connection, written by the dump_diagnostics service to find slow or dropping devices
+"""
+
+
+def get_diagnostics(hass: HomeAssistant) -> dict:
+    clients = hass.data[DOMAIN]['tcp_client']
+    channels = hass.data[DOMAIN]['channels']
+    devices = []
+    for client, state in zip(clients, to_states(client.state for client in clients)):
+        devices.append({
+            'ip': client.ip,
+            'did': client.device_id,
+            'pid': client.pid,
+            'model_name': client.device_model_name,
+            'available': client.available,
+            'reconnect': client.reconnect_state,
+            'writes': client.write_counters,
+            'health': client.health.as_dict(),
+            'state': dict(client.state),
+            'fields': state.as_dict(),
+            # unique_id -> frames of the transitions and effects sent and missed
+            'effects': {channel.unique_id: channel.effects.counters
+                        for channel in channels.get(client.device_id, [])},
+        })
+
+    poller = hass.data[DOMAIN].get('poller')
+    poll = None
+    if poller is not None:
+        poll = {'polls': poller.polls, 'skipped': poller.skipped, 'queue': poller.queue}
+
+    return {'devices': devices, 'poll': poll}
+
+
+async def async_dump_diagnostics(hass: HomeAssistant, call: ServiceCall) -> None:
+    path = hass.config.path(DIAGNOSTICS_FILE)
+    data = json.dumps(get_diagnostics(hass), indent=2)
+
+    def write() -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
+
+    await hass.async_add_executor_job(write)
+    _LOGGER.info('diagnostics written to %s', path)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import math
+from functools import partial
+from typing import Callable, Iterable, Optional, Sequence, Union
+from .const import (
+    SWITCH,
+    WORK_MODE,
+    TEMP,
+    BRIGHT,
+    HUE,
+    SAT,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+"""
+transitions, flashes and effects as precomputed lists of CMD_SET payloads, streamed at a bounded frame rate
+frames go out through async_tcp_client.async_control like any other control, a new control cancels them
+"""
+
+# frames per second a device is sent at most, see set_max_fps
+MAX_FPS = 10
+# seconds between building the frames of a group and their first frame, so every bulb starts together
+SYNC_LEAD = 0.1
+# dpid interpolated from one value to the other, the rest is set with the first frame
+FADED_DPID = (TEMP, BRIGHT, HUE, SAT)
+FLASH_SHORT_CYCLES = 1
+FLASH_LONG_CYCLES = 5
+# seconds off and on of a flash
+FLASH_PERIOD = 0.5
+
+
+def set_max_fps(fps: float) -> None:
+    """
+    frame rate bound of every device, from the transition_fps option
+    :param fps:
+    :return:
+    """
+    global MAX_FPS
+    MAX_FPS = max(1, fps)
+
+
+def frame_rate(fps: Optional[float] = None) -> float:
+    """
+    :param fps: wanted, default MAX_FPS
+    :return: fps within MAX_FPS
+    """
+    return MAX_FPS if fps is None else min(fps, MAX_FPS)
+
+
+def _ease_in_out(t: float) -> float:
+    return t * t * (3 - 2 * t)
+
+
+# name -> position 0..1 at time 0..1
+CURVES = {
+    'linear': lambda t: t,
+    'ease_in_out': _ease_in_out,
+}
+
+
+def curve_table(curve: Union[str, Callable[[float], float], Sequence[float]], count: int) -> list:
+    """
+    position of each of count frames, the last one at 1
+    :param curve: name in CURVES, function of time, or precomputed positions resampled to count
+    :param count:
+    :return:
+    """
+    if type(curve) is str:
+        curve = CURVES[curve]
+
+    if callable(curve):
+        return [curve((i + 1) / count) for i in range(count)]
+
+    # a precomputed table, taken at the nearest sample
+    last = len(curve) - 1
+    return [curve[round((i + 1) / count * last)] for i in range(count)]
+
+
+def _blend(key: str, start: int, end: int, position: float) -> int:
+    if HUE == key:
+        # the short way round the color wheel
+        delta = (end - start + 180) % 360 - 180
+        return int(round(start + delta * position)) % 360
+    return int(round(start + (end - start) * position))
+
+
+def transition_frames(state: dict, target: dict, count: int, curve='linear') -> list:
+    """
+    payloads moving a device from state to target in count frames, each with the dpid changed since the one before
+    turning on fades up from 0 brightness, turning off fades down and puts the brightness back with the off frame
+    :param state: dpid -> value the device has now
+    :param target: dpid -> value it ends with, a CMD_SET payload
+    :param count: frames, >= 1
+    :param curve: see curve_table
+    :return:
+    """
+    start = dict(state)
+    end = dict(target)
+    turning_on = 255 == target.get(SWITCH) and 0 == state.get(SWITCH, 0)
+    turning_off = 0 == target.get(SWITCH) and 0 != state.get(SWITCH, 0)
+    if turning_on:
+        start[BRIGHT] = 0
+        end.setdefault(BRIGHT, state.get(BRIGHT) or 1000)
+    elif turning_off and state.get(BRIGHT) is not None:
+        # stay on while fading, the last frame switches off
+        del end[SWITCH]
+        end[BRIGHT] = 0
+
+    faded = [key for key in FADED_DPID if type(start.get(key)) is int and type(end.get(key)) is int
+             and start[key] != end[key]]
+    frames = []
+    previous = {}
+    for position in curve_table(curve, count):
+        frame = {key: value for key, value in end.items() if key not in faded} if not frames else {}
+        for key in faded:
+            value = _blend(key, start[key], end[key], position)
+            if previous.get(key) != value:
+                frame[key] = value
+                previous[key] = value
+        frames.append(frame)
+
+    if turning_off and state.get(BRIGHT) is not None:
+        frames[-1] = dict(frames[-1])
+        frames[-1][SWITCH] = 0
+        frames[-1][BRIGHT] = state[BRIGHT]
+    return frames
+
+
+def flash_frames(state: dict, cycles: int) -> list:
+    """
+    off and on again cycles times at FLASH_PERIOD, then back to the state the device had
+    :param state:
+    :param cycles:
+    :return:
+    """
+    on = state.get(SWITCH, 0)
+    frames = []
+    for _ in range(cycles):
+        frames += [{SWITCH: 0 if on else 255}, {SWITCH: on if on else 0}]
+    return frames
+
+
+def _colorloop(state: dict, fps: float) -> list:
+    """
+    once round the color wheel in 10 s
+    :param state:
+    :param fps:
+    :return:
+    """
+    count = max(1, int(10 * fps))
+    hue = state.get(HUE) if type(state.get(HUE)) is int else 0
+    frames = [{SWITCH: 255, WORK_MODE: 0, SAT: min(1000, state.get(SAT) or 1000)}]
+    frames += [{} for _ in range(count - 1)]
+    for i in range(count):
+        frames[i][HUE] = (hue + int(360 * i / count)) % 360
+    return frames
+
+
+def _breathe(state: dict, fps: float) -> list:
+    """
+    down to a tenth of the brightness and back in 4 s
+    :param state:
+    :param fps:
+    :return:
+    """
+    count = max(2, int(4 * fps))
+    brightness = state.get(BRIGHT) if type(state.get(BRIGHT)) is int and state.get(BRIGHT) else 1000
+    frames = []
+    for i in range(count):
+        level = 0.55 + 0.45 * math.cos(2 * math.pi * i / count)
+        frames.append({BRIGHT: max(1, int(brightness * level))})
+    frames[0][SWITCH] = 255
+    return frames
+
+
+# name -> frames of one cycle from the state, repeated until cancelled
+EFFECTS = {
+    'colorloop': _colorloop,
+    'breathe': _breathe,
+}
+
+
+class EffectRunner(object):
+    """
+    streams the frames of one transition, flash or effect to a device, one at a time
+    a frame whose time passed while the one before was sent is merged into the next and counted as missed
+    sent & missed: frames of every run so far
+    listeners are called with the name of a run once it ended, done or cancelled
+    """
+
+    def __init__(self, send: Callable):
+        """
+        :param send: coroutine function taking a payload, async_control of the device
+        """
+        self._send = send
+        self._task = None
+        self._listeners = []
+        self.name = None
+        self.sent = 0
+        self.missed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def counters(self) -> dict:
+        return {'running': self.name if self.running else None, 'sent': self.sent, 'missed': self.missed}
+
+    def add_listener(self, listener: Callable[[str], None]) -> Callable[[], None]:
+        """
+        call listener with the name of every run that ends
+        :param listener:
+        :return: remove listener
+        """
+        self._listeners.append(listener)
+
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    def start(self, name: str, frames: list, fps: float, repeat: bool = False, at: Optional[float] = None) -> None:
+        """
+        replace whatever runs with these frames
+        :param name: transition, flash or the effect name
+        :param frames: payloads, one per 1 / fps seconds
+        :param fps: bound by MAX_FPS
+        :param repeat: start over after the last frame until cancelled
+        :param at: loop time of the first frame, the same for a group
+        :return:
+        """
+        self.cancel()
+        if not frames:
+            return
+        self.name = name
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(name, frames, 1 / frame_rate(fps), repeat, at))
+        self._task.add_done_callback(partial(self._done, name))
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def async_stop(self) -> None:
+        """
+        cancel the run and wait for it to end, on unload
+        :return:
+        """
+        task = self._task
+        self.cancel()
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _done(self, name: str, task: asyncio.Task) -> None:
+        if task is self._task:
+            self._task = None
+        for listener in list(self._listeners):
+            listener(name)
+
+    async def _run(self, name: str, frames: list, interval: float, repeat: bool, at: Optional[float]) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time() if at is None else at
+        count = len(frames)
+        sent = missed = 0
+        i = 0
+        try:
+            while repeat or i < count:
+                delay = start + i * interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    late = 0
+                else:
+                    # the frames whose time passed go out with this one
+                    late = min(int(-delay / interval), count - 1 if repeat else count - 1 - i)
+                payload = {}
+                for j in range(i, i + late + 1):
+                    payload.update(frames[j % count])
+                missed += late
+                self.missed += late
+                i += late + 1
+                if payload:
+                    await self._send(payload)
+                    sent += 1
+                    self.sent += 1
+        finally:
+            if missed:
+                _LOGGER.debug('%s: %d frames sent, %d missed', name, sent, missed)
+
+
+def start_many(runners: Iterable[EffectRunner], name: str, frames: Iterable[list], fps: float) -> None:
+    """
+    start a transition on many devices with the same first frame time
+    :param runners:
+    :param name:
+    :param frames: frames of each runner, same order
+    :param fps:
+    :return:
+    """
+    at = asyncio.get_running_loop().time() + SYNC_LEAD
+    for runner, items in zip(runners, frames):
+        runner.start(name, items, fps, at=at)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Iterable, Optional
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.helpers import entity_registry
+import homeassistant.helpers.config_validation as cv
+from .const import DOMAIN
+from .channel import DeviceChannel
+from .state import to_payload
+from .effects import frame_rate, start_many, transition_frames
+
+_LOGGER = logging.getLogger(__name__)
+
+# seconds the whole group has to ack its CMD_SET, stragglers are reported as failed
+DEADLINE = 3
+
+"""
+one payload to many devices at once, every connection sends its CMD_SET without waiting for the others
+"""
+
+
+def _on_with_color(data: dict) -> dict:
+    """
+    brightness and colors turn the lights on, they cannot go with state: false
+    :param data:
+    :return:
+    """
+    if data.get('state') is False and any(data.get(key) is not None
+                                          for key in ('brightness', 'color_temp', 'hs_color')):
+        raise vol.Invalid('state: false cannot be combined with brightness, color_temp or hs_color')
+    return data
+
+
+def _dpid(key: str) -> str:
+    """
+    a dpid is a number, sent as a string key
+    :param key:
+    :return:
+    """
+    if not key.isdigit():
+        raise vol.Invalid(f'dpid must be a number, got {key!r}')
+    return key
+
+
+SET_MANY_SCHEMA = vol.All(
+    vol.Schema({
+        vol.Required('entity_id'): cv.entity_ids,
+        vol.Optional('state'): cv.boolean,
+        vol.Optional('brightness'): vol.All(vol.Coerce(int), vol.Range(min=0, max=255)),
+        vol.Optional('color_temp'): vol.All(vol.Coerce(int), vol.Range(min=0, max=500)),
+        vol.Optional('hs_color'): vol.All(
+            vol.ExactSequence((vol.All(vol.Coerce(float), vol.Range(min=0, max=360)),
+                               vol.All(vol.Coerce(float), vol.Range(min=0, max=100)))),
+            vol.Coerce(tuple)),
+        vol.Optional('data'): {vol.All(vol.Coerce(str), _dpid): vol.Coerce(int)},
+        vol.Optional('timeout'): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=30)),
+        vol.Optional('transition'): vol.All(vol.Coerce(float), vol.Range(min=0, max=300)),
+    }),
+    _on_with_color,
+)
+
+
+async def control_many(channels: Iterable[DeviceChannel], payload: dict,
+                       timeout: Optional[float] = None) -> dict:
+    """
+    send the same control to every channel concurrently under a single deadline
+    channels of the same device within the write window share its CMD_SET
+    :param channels:
+    :param payload: dpid -> value, as the entities send it
+    :param timeout: seconds for the whole group, default DEADLINE
+    :return: unique_id -> True when the device acked before the deadline
+    """
+    timeout = DEADLINE if timeout is None else timeout
+    tasks = {}
+    for channel in channels:
+        tasks[channel.unique_id] = asyncio.ensure_future(channel.async_control(payload, wait=True, timeout=timeout))
+
+    if not tasks:
+        return {}
+
+    await asyncio.wait(tasks.values(), timeout=timeout)
+
+    result = {}
+    for unique_id, task in tasks.items():
+        if not task.done():
+            # the frame is already out (async_control shields it), only the wait for its ack ends here
+            task.cancel()
+            result[unique_id] = False
+        elif task.cancelled() or task.exception() is not None:
+            result[unique_id] = False
+        else:
+            result[unique_id] = task.result()
+
+    return result
+
+
+def build_payload(data: dict) -> dict:
+    """
+    dpid payload of a set_many call, same mapping as the light and switch entities
+    :param data: service data
+    :return:
+    """
+    fields = {
+        'on': data.get('state'),
+        'brightness': data.get('brightness'),
+        'color_temp': data.get('color_temp'),
+        'hs_color': data.get('hs_color'),
+    }
+    if any(fields[key] is not None for key in ('brightness', 'color_temp', 'hs_color')):
+        fields['on'] = True
+        fields['work_mode'] = 0
+
+    payload = to_payload(fields)
+
+    # raw dpid values last, they win over the mapped ones
+    for key, value in (data.get('data') or {}).items():
+        payload[str(key)] = value
+
+    return payload
+
+
+async def async_set_many(hass: HomeAssistant, call: ServiceCall) -> None:
+    """
+    set_many service: entity_id, state, brightness, color_temp, hs_color, data, timeout, transition
+    :param hass:
+    :param call: data validated by SET_MANY_SCHEMA
+    :return:
+    """
+    payload = build_payload(call.data)
+    if not payload:
+        return
+
+    entity_ids = call.data['entity_id']
+
+    registry = entity_registry.async_get(hass)
+    known = {channel.unique_id: channel for channels in hass.data[DOMAIN]['channels'].values()
+             for channel in channels}
+    selected = {}
+    for entity_id in entity_ids:
+        entry = registry.async_get(entity_id)
+        channel = known.get(entry.unique_id) if entry is not None else None
+        if channel is None:
+            _LOGGER.warning('set_many: %s is not a %s device', entity_id, DOMAIN)
+            continue
+        # one control per entity, even when it is listed twice
+        selected[channel.unique_id] = channel
+
+    transition = call.data.get('transition')
+    if transition:
+        # every channel fades from its own state, the first frames go out together
+        fps = frame_rate()
+        count = max(1, round(transition * fps))
+        channels = list(selected.values())
+        start_many([channel.effects for channel in channels], 'transition',
+                   [transition_frames(channel.state, payload, count) for channel in channels], fps)
+        return
+
+    result = await control_many(selected.values(), payload, call.data.get('timeout'))
+    failed = [unique_id for unique_id, acked in result.items() if not acked]
+    if failed:
+        _LOGGER.warning('set_many: %d/%d entities did not ack %s: %s', len(failed), len(result), payload, failed)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import bisect
+import time
+from typing import Optional
+
+"""
+per connection counters, fed by async_tcp_client, read by the diagnostic sensors and the diagnostics dump
+"""
+
+# upper bounds of the rtt histogram buckets, ms; the last bucket is everything above
+RTT_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class DeviceHealth(object):
+
+    def __init__(self):
+        # time.time() of the last frame received
+        self.last_seen = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.rtt_last = None
+        self._rtt_sum = 0.0
+        self._rtt_count = 0
+        self._rtt_histogram = [0] * (len(RTT_BUCKETS) + 1)
+
+    @property
+    def reconnects(self) -> int:
+        """
+        connects after the first one
+        :return:
+        """
+        return max(0, self.connects - 1)
+
+    @property
+    def rtt_avg(self) -> Optional[float]:
+        """
+        ms
+        :return:
+        """
+        if 0 == self._rtt_count:
+            return None
+        return self._rtt_sum / self._rtt_count
+
+    @property
+    def rtt_histogram(self) -> dict:
+        """
+        '<=10': count, ..., '>2500': count
+        :return:
+        """
+        histogram = {f'<={bound}': count for bound, count in zip(RTT_BUCKETS, self._rtt_histogram)}
+        histogram[f'>{RTT_BUCKETS[-1]}'] = self._rtt_histogram[-1]
+        return histogram
+
+    def seen(self, size: int) -> None:
+        self.last_seen = time.time()
+        self.bytes_in += size
+
+    def sent(self, size: int) -> None:
+        self.frames_out += 1
+        self.bytes_out += size
+
+    def rtt(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.rtt_last = ms
+        self._rtt_sum += ms
+        self._rtt_count += 1
+        self._rtt_histogram[bisect.bisect_left(RTT_BUCKETS, ms)] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            'last_seen': self.last_seen,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'frames_in': self.frames_in,
+            'frames_out': self.frames_out,
+            'timeouts': self.timeouts,
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'connect_failures': self.connect_failures,
+            'disconnects': self.disconnects,
+            'rtt_last': self.rtt_last,
+            'rtt_avg': self.rtt_avg,
+            'rtt_histogram': self.rtt_histogram,
+        }
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+from .reconnect import MAX_CONCURRENT_CONNECTS
+
+_LOGGER = logging.getLogger(__name__)
+
+"""
+one thread serving the sockets of every tcp_client through a selector, for the synchronous code path
+callbacks run on that thread, other threads hand work over with call_soon
+"""
+
+_default_loop = None
+_default_lock = threading.Lock()
+
+
+def default_loop() -> 'IOLoop':
+    """
+    the loop shared by every tcp_client, started on first use
+    :return:
+    """
+    global _default_loop
+    with _default_lock:
+        if _default_loop is None:
+            _default_loop = IOLoop()
+            _default_loop.start()
+        return _default_loop
+
+
+class TimerHandle(object):
+    __slots__ = ('callback', 'args', 'cancelled')
+
+    def __init__(self, callback: Callable, args: tuple):
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class IOLoop(object):
+    """
+    selector + timers + a queue of callbacks from other threads, asyncio style but tiny
+    only call_soon is thread safe, the rest is for callbacks already on the loop thread
+    connect slots cap the connects in flight like ReconnectScheduler does on the event loop
+    """
+
+    def __init__(self, max_connects: int = MAX_CONCURRENT_CONNECTS):
+        self._selector = selectors.DefaultSelector()
+        # fd -> [reader, writer]
+        self._callbacks = {}
+        # (when, seq, handle)
+        self._timers = []
+        self._seq = itertools.count()
+        self._ready = deque()
+        # written by call_soon to wake up select
+        self._wakeup_read, self._wakeup_write = socket.socketpair()
+        self._wakeup_read.setblocking(False)
+        self._wakeup_write.setblocking(False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self._thread = None
+        self._stopping = False
+        self._max_connects = max_connects
+        self._connecting = 0
+        # callbacks waiting for a connect slot
+        self._connect_waiters = deque()
+
+    @property
+    def connecting(self) -> int:
+        return self._connecting
+
+    @property
+    def stopped(self) -> bool:
+        """
+        stop() was called, callbacks handed over now never run
+        :return:
+        """
+        return self._stopping
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='cozylife-io', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        stop the thread and close the selector, the loop cannot be started again
+        :return:
+        """
+        self._stopping = True
+        if self._thread is None:
+            self._close()
+            return
+
+        self._wake()
+        # run() closes on its way out
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _close(self) -> None:
+        self._selector.close()
+        self._wakeup_read.close()
+        self._wakeup_write.close()
+
+    def in_loop(self) -> bool:
+        return self._thread is threading.current_thread()
+
+    def call_soon(self, callback: Callable, *args) -> None:
+        """
+        run callback on the loop thread, from any thread
+        :param callback:
+        :param args:
+        :return:
+        """
+        self._ready.append((callback, args))
+        if not self.in_loop():
+            self._wake()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """
+        loop thread only
+        :param delay: seconds
+        :param callback:
+        :param args:
+        :return: handle to cancel it
+        """
+        handle = TimerHandle(callback, args)
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._seq), handle))
+        return handle
+
+    def _wake(self) -> None:
+        try:
+            self._wakeup_write.send(b'\0')
+        except OSError:
+            # already full of wake ups, or closed by stop
+            pass
+
+    def _update(self, sock: socket.socket, reader: Optional[Callable], writer: Optional[Callable]) -> None:
+        fd = sock.fileno()
+        events = (selectors.EVENT_READ if reader is not None else 0) | \
+                 (selectors.EVENT_WRITE if writer is not None else 0)
+        registered = fd in self._callbacks
+        if not events:
+            if registered:
+                del self._callbacks[fd]
+                self._selector.unregister(fd)
+            return
+
+        self._callbacks[fd] = [reader, writer]
+        if registered:
+            self._selector.modify(fd, events)
+        else:
+            self._selector.register(fd, events)
+
+    def _get(self, sock: socket.socket) -> list:
+        return self._callbacks.get(sock.fileno(), [None, None])
+
+    def add_reader(self, sock: socket.socket, callback: Callable) -> None:
+        self._update(sock, callback, self._get(sock)[1])
+
+    def remove_reader(self, sock: socket.socket) -> None:
+        self._update(sock, None, self._get(sock)[1])
+
+    def add_writer(self, sock: socket.socket, callback: Callable) -> None:
+        self._update(sock, self._get(sock)[0], callback)
+
+    def remove_writer(self, sock: socket.socket) -> None:
+        self._update(sock, self._get(sock)[0], None)
+
+    def acquire_connect(self, callback: Callable) -> bool:
+        """
+        take a connect slot, or queue callback for the next free one
+        :param callback: called with no argument once a slot is free, it holds the slot then
+        :return: a slot was free, the caller holds it now
+        """
+        if self._connecting < self._max_connects:
+            self._connecting += 1
+            return True
+        self._connect_waiters.append(callback)
+        return False
+
+    def release_connect(self) -> None:
+        if self._connect_waiters:
+            # the slot goes to the next waiter as is
+            self.call_soon(self._connect_waiters.popleft())
+            return
+        self._connecting -= 1
+
+    def _run_once(self) -> None:
+        timeout = None
+        if self._ready:
+            timeout = 0
+        elif self._timers:
+            timeout = max(0.0, self._timers[0][0] - time.monotonic())
+
+        for key, events in self._selector.select(timeout):
+            if key.fileobj is self._wakeup_read:
+                try:
+                    while self._wakeup_read.recv(4096):
+                        pass
+                except (BlockingIOError, InterruptedError):
+                    pass
+                continue
+
+            callbacks = self._callbacks.get(key.fd)
+            if callbacks is None:
+                continue
+            if events & selectors.EVENT_READ and callbacks[0] is not None:
+                self._ready.append((callbacks[0], ()))
+            if events & selectors.EVENT_WRITE and callbacks[1] is not None:
+                self._ready.append((callbacks[1], ()))
+
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, handle = heapq.heappop(self._timers)
+            if not handle.cancelled:
+                self._ready.append((handle.callback, handle.args))
+
+        # callbacks queued by these run on the next round
+        for _ in range(len(self._ready)):
+            callback, args = self._ready.popleft()
+            try:
+                callback(*args)
+            except Exception:
+                _LOGGER.exception('io loop callback error')
+
+    def run(self) -> None:
+        try:
+            while not self._stopping:
+                self._run_once()
+        finally:
+            self._close()
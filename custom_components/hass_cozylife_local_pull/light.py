@@ -22,17 +22,17 @@ from homeassistant.components.light import (
     COLOR_MODE_UNKNOWN,
     FLASH_LONG,
     FLASH_SHORT,
-    SUPPORT_EFFECT,
-    SUPPORT_FLASH,
-    SUPPORT_TRANSITION,
     LightEntity,
+    LightEntityFeature,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from typing import Any, Final, Literal, TypedDict, final
 from .const import (
     DOMAIN,
+    SIGNAL_DEVICE_READY,
     SWITCH_TYPE_CODE,
     LIGHT_TYPE_CODE,
     LIGHT_DPID,
@@ -43,37 +43,50 @@ from .const import (
     HUE,
     SAT,
 )
-from .tcp_client import tcp_client
+from .channel import DeviceChannel
+from .state import DeviceState, to_payload
+from .effects import (
+    EFFECTS,
+    FLASH_LONG_CYCLES,
+    FLASH_PERIOD,
+    FLASH_SHORT_CYCLES,
+    flash_frames,
+    frame_rate,
+    transition_frames,
+)
 import logging
 from homeassistant.components import zeroconf
 
 _LOGGER = logging.getLogger(__name__)
-_LOGGER.info(__name__)
 
-def setup_platform(
+async def async_setup_platform(
     hass: HomeAssistant,
     config: ConfigType,
-    add_entities: AddEntitiesCallback,
+    async_add_entities: AddEntitiesCallback,
     discovery_info: DiscoveryInfoType | None = None
 ) -> None:
     """Set up the sensor platform."""
     # We only want this platform to be set up via discovery.
-    _LOGGER.info(
-        f'setup_platform.hass={hass},config={config},add_entities={add_entities},discovery_info={discovery_info}')
     # zc = await zeroconf.async_get_instance(hass)
-    # _LOGGER.info(f'zc={zc}')
-    _LOGGER.info(f'hass.data={hass.data[DOMAIN]}')
-    _LOGGER.info(f'discovery_info={discovery_info}')
 
     if discovery_info is None:
         return
     
+    channels = hass.data[DOMAIN]['channels']
     lights = []
-    for item in hass.data[DOMAIN]['tcp_client']:
+    for item in hass.data[DOMAIN]['devices'].values():
+        if LIGHT_TYPE_CODE == item.device_type_code:
+            lights += [CozyLifeLight(channel) for channel in channels.get(item.device_id, [])]
+    
+    async_add_entities(lights)
+    
+    @callback
+    def device_ready(item) -> None:
+        """Add the entity of a device that answered CMD_INFO after setup."""
         if LIGHT_TYPE_CODE == item.device_type_code:
-            lights.append(CozyLifeLight(item))
+            async_add_entities([CozyLifeLight(channel) for channel in channels.get(item.device_id, [])])
     
-    add_entities(lights)
+    async_dispatcher_connect(hass, SIGNAL_DEVICE_READY, device_ready)
 
 
 class CozyLifeLight(LightEntity):
@@ -81,10 +94,15 @@ class CozyLifeLight(LightEntity):
     # _attr_color_mode: str | None = None
     # _attr_color_temp: int | None = None
     # _attr_hs_color = None
-    _tcp_client = None
+    _channel = None
+    # state is pushed from the device state cache
+    _attr_should_poll = False
     
     _attr_supported_color_modes = {COLOR_MODE_BRIGHTNESS, COLOR_MODE_ONOFF}
     _attr_color_mode = COLOR_MODE_BRIGHTNESS
+    # streamed by the channel's EffectRunner
+    _attr_supported_features = LightEntityFeature.TRANSITION | LightEntityFeature.FLASH | LightEntityFeature.EFFECT
+    _attr_effect_list = list(EFFECTS)
     
     # _unique_id = str
     # _attr_is_on = True
@@ -93,46 +111,72 @@ class CozyLifeLight(LightEntity):
     # _attr_color_temp = int
     # _attr_hs_color = (float, float)
     
-    def __init__(self, tcp_client: tcp_client) -> None:
+    def __init__(self, channel: DeviceChannel) -> None:
         """Initialize the sensor."""
-        _LOGGER.info('__init__')
-        self._tcp_client = tcp_client
-        self._unique_id = tcp_client.device_id
-        self._name = tcp_client.device_model_name + ' ' + tcp_client.device_id[-4:]
+        self._channel = channel
+        self._unique_id = channel.unique_id
+        self._name = channel.name
+        self._state = DeviceState(channel.state)
         
-        _LOGGER.info(f'before:{self._unique_id}._attr_color_mode={self._attr_color_mode}._attr_supported_color_modes='
-                     f'{self._attr_supported_color_modes}.dpid={tcp_client.dpid}')
         # h s
-        if 3 in tcp_client.dpid:
+        if 3 in channel.dpid:
             self._attr_color_mode = COLOR_MODE_COLOR_TEMP
             self._attr_supported_color_modes.add(COLOR_MODE_COLOR_TEMP)
         
-        if 5 in tcp_client.dpid or 6 in tcp_client.dpid:
+        if 5 in channel.dpid or 6 in channel.dpid:
             self._attr_color_mode = COLOR_MODE_HS
             self._attr_supported_color_modes.add(COLOR_MODE_HS)
         
-        _LOGGER.info(f'after:{self._unique_id}._attr_color_mode={self._attr_color_mode}._attr_supported_color_modes='
-                     f'{self._attr_supported_color_modes}.dpid={tcp_client.dpid}')
+        _LOGGER.debug('%s color_mode=%s supported_color_modes=%s dpid=%s', self._unique_id,
+                      self._attr_color_mode, self._attr_supported_color_modes, channel.dpid)
         
         self._refresh_state()
     
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the device state cache and to the end of effects."""
+        self.async_on_remove(self._channel.add_listener(self._handle_state_update))
+        self.async_on_remove(self._channel.effects.add_listener(self._handle_effect_done))
+    
+    async def async_will_remove_from_hass(self) -> None:
+        """Stop the transition or effect still streaming to the device."""
+        await self._channel.async_stop()
+    
+    @callback
+    def _handle_state_update(self, changed: dict) -> None:
+        """Device pushed new state."""
+        self._state.update(changed)
+        self._refresh_state()
+        self.async_write_ha_state()
+    
+    @callback
+    def _handle_effect_done(self, name: str) -> None:
+        """A transition, flash or effect ended, the effect attribute is gone."""
+        self.async_write_ha_state()
+    
+    async def async_update(self) -> None:
+        """Query the device, the reply lands in the state cache."""
+        await self._channel.async_query()
+        self._refresh_state()
+    
     def _refresh_state(self):
         """
-        query device & set attr
+        set attr from the converted device state
         :return:
         """
-        self._state = self._tcp_client.query()
-        _LOGGER.info(f'_state={self._state}')
-        self._attr_is_on = 0 < self._state['1']
+        state = self._state
+        if state.on is None:
+            return
         
-        if '4' in self._state:
-            self._attr_brightness = int(self._state['4'] / 4)
+        self._attr_is_on = state.on
         
-        if '5' in self._state:
-            self._attr_hs_color = (int(self._state['5']), int(self._state['6'] / 10))
+        if state.brightness is not None:
+            self._attr_brightness = state.brightness
         
-        if '3' in self._state:
-            self._attr_color_temp = 500 - int(self._state['3'] / 2)
+        if state.hue is not None:
+            self._attr_hs_color = state.hs_color
+        
+        if state.color_temp is not None:
+            self._attr_color_temp = state.color_temp
     
     @property
     def name(self) -> str:
@@ -141,12 +185,11 @@ class CozyLifeLight(LightEntity):
     @property
     def available(self) -> bool:
         """Return if the device is available."""
-        return True
+        return self._channel.available
     
     @property
     def is_on(self) -> bool:
         """Return True if entity is on."""
-        self._refresh_state()
         return self._attr_is_on
     
     @property
@@ -159,7 +202,7 @@ class CozyLifeLight(LightEntity):
         """Return a unique ID."""
         return self._unique_id
 
-    def turn_on(self, **kwargs: Any) -> None:
+    async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the entity on."""
         self._attr_is_on = True
         brightness = kwargs.get(ATTR_BRIGHTNESS)
@@ -170,32 +213,52 @@ class CozyLifeLight(LightEntity):
         rgb = kwargs.get(ATTR_RGB_COLOR)
         flash = kwargs.get(ATTR_FLASH)
         effect = kwargs.get(ATTR_EFFECT)
-        _LOGGER.info(f'turn_on.kwargs={kwargs}')
+        transition = kwargs.get(ATTR_TRANSITION)
+        _LOGGER.debug('%s turn_on %s', self._unique_id, kwargs)
         
-        payload = {'1': 255, '2': 0}
-        if brightness is not None:
-            payload['4'] = brightness * 4
-            self._attr_brightness = brightness
+        effects = self._channel.effects
+        if flash is not None:
+            cycles = FLASH_LONG_CYCLES if FLASH_LONG == flash else FLASH_SHORT_CYCLES
+            effects.start('flash', flash_frames(self._channel.state, cycles), 1 / FLASH_PERIOD)
+            return None
         
-        if hs_color is not None:
-            payload['5'] = int(hs_color[0])
-            payload['6'] = int(hs_color[1] * 10)
-            self._attr_hs_color = hs_color
+        if effect in EFFECTS:
+            fps = frame_rate()
+            effects.start(effect, EFFECTS[effect](self._channel.state, fps), fps, repeat=True)
+            return None
         
-        if colortemp is not None:
-            payload['3'] = 1000 - colortemp * 2
+        payload = to_payload({
+            'on': True,
+            'work_mode': 0,
+            'brightness': brightness,
+            'hs_color': hs_color,
+            'color_temp': colortemp,
+        })
         
-        self._tcp_client.control(payload)
-        self._refresh_state()
+        if transition:
+            fps = frame_rate()
+            effects.start('transition', transition_frames(self._channel.state, payload, max(1, round(transition * fps))),
+                          fps)
+            return None
+        
+        # the state is updated optimistically, the device confirms or overrides it by itself
+        await self._channel.async_control(payload)
         return None
         raise NotImplementedError()
     
-    def turn_off(self, **kwargs: Any) -> None:
+    async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn the entity off."""
         self._attr_is_on = False
-        _LOGGER.info(f'turn_off.kwargs={kwargs}')
-        self._tcp_client.control({'1': 0})
-        self._refresh_state()
+        _LOGGER.debug('%s turn_off %s', self._unique_id, kwargs)
+        payload = to_payload({'on': False})
+        transition = kwargs.get(ATTR_TRANSITION)
+        if transition:
+            fps = frame_rate()
+            self._channel.effects.start(
+                'transition', transition_frames(self._channel.state, payload, max(1, round(transition * fps))), fps)
+            return None
+        
+        await self._channel.async_control(payload)
         
         return None
         
@@ -204,23 +267,26 @@ class CozyLifeLight(LightEntity):
     @property
     def hs_color(self) -> tuple[float, float] | None:
         """Return the hue and saturation color value [float, float]."""
-        _LOGGER.info('hs_color')
-        self._refresh_state()
         return self._attr_hs_color
     
     @property
     def brightness(self) -> int | None:
         """Return the brightness of this light between 0..255."""
-        _LOGGER.info('brightness')
-        self._refresh_state()
         return self._attr_brightness
     
     @property
     def color_mode(self) -> str | None:
         """Return the color mode of the light."""
-        _LOGGER.info('color_mode')
         return self._attr_color_mode
     
+    @property
+    def effect(self) -> str | None:
+        """Return the effect running now."""
+        effects = self._channel.effects
+        if effects.running and effects.name in EFFECTS:
+            return effects.name
+        return None
+    
     # def set_brightness(self, b):
     #     _LOGGER.info('set_brightness')
     #
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+"""
+when to query each connected device, shared by every device so 150 devices are not queried in the same instant
+"""
+
+POLL_INTERVAL = 30
+MIN_INTERVAL = 5
+MAX_INTERVAL = 120
+# queries per second over all devices
+MAX_RATE = 5
+# share of the interval a poll is moved by at random
+JITTER = 0.2
+# unanswered polls in a row before the connection is dropped
+MAX_FAILURES = 2
+
+
+class _PollEntry(object):
+    __slots__ = ('interval', 'failures', 'touched_at', 'seen')
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.failures = 0
+        self.touched_at = None
+        # health.last_seen when the scheduler last looked, newer frames came without a query
+        self.seen = None
+
+
+class PollScheduler(object):
+    """
+    one task queries the connected devices, at most max_rate per second
+    the first polls are spread at random over the interval, every next one is moved by up to jitter
+    a device whose state changed (pushed, polled or controlled) is polled every min_interval,
+    each poll that finds nothing new doubles its interval up to max_interval
+    a device that sent a frame within its interval is not queried, reporting devices are never polled
+    max_failures unanswered polls in a row drop the connection, the ReconnectScheduler takes it from there
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL, min_interval: float = MIN_INTERVAL,
+                 max_interval: float = MAX_INTERVAL, max_rate: float = MAX_RATE, jitter: float = JITTER):
+        self._interval = interval
+        self._min_interval = min(min_interval, interval)
+        self._max_interval = max(max_interval, interval)
+        self._spacing = 1 / max_rate
+        self._jitter = jitter
+        # client -> _PollEntry of every connected device
+        self._clients = {}
+        # (due, seq, client), stale when due is not _due[client]
+        self._heap = []
+        # client -> loop time of its next poll, not there while its poll runs
+        self._due = {}
+        self._seq = itertools.count()
+        self._next_slot = 0.0
+        self._wake = asyncio.Event()
+        self._task = None
+        self._polls = set()
+        self.polls = 0
+        self.skipped = 0
+
+    @property
+    def queue(self) -> int:
+        """
+        devices waiting for their poll
+        :return:
+        """
+        return len(self._due)
+
+    def _schedule(self, client, due: float) -> None:
+        self._due[client] = due
+        heapq.heappush(self._heap, (due, next(self._seq), client))
+        self._wake.set()
+
+    def _jittered(self, interval: float) -> float:
+        return interval * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def add(self, client) -> None:
+        """
+        the client connected, its first poll is at a random point of the interval
+        :param client: async_tcp_client
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        self._clients[client] = _PollEntry(self._interval)
+        self._schedule(client, loop.time() + random.uniform(0, self._interval))
+
+    def remove(self, client) -> None:
+        """
+        the client disconnected, it is added again on connect
+        :param client:
+        :return:
+        """
+        self._clients.pop(client, None)
+        self._due.pop(client, None)
+
+    def touch(self, client) -> None:
+        """
+        the state of the client changed, poll it every min_interval for a while
+        :param client:
+        :return:
+        """
+        entry = self._clients.get(client)
+        if entry is None:
+            return
+
+        now = asyncio.get_running_loop().time()
+        entry.touched_at = now
+        entry.interval = self._min_interval
+        due = self._due.get(client)
+        if due is not None and due > now + self._min_interval:
+            self._schedule(client, now + self._jittered(self._min_interval))
+
+    def start(self) -> None:
+        """
+        start the poll task, must be called from the event loop
+        :return:
+        """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def async_stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for task in list(self._polls):
+            task.cancel()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wake.clear()
+            while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._wake.wait()
+                continue
+
+            # an earlier poll may be scheduled meanwhile, wake up for it
+            delay = max(self._heap[0][0], self._next_slot) - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, client = heapq.heappop(self._heap)
+            del self._due[client]
+            self._next_slot = loop.time() + self._spacing
+            task = loop.create_task(self._poll(client))
+            self._polls.add(task)
+            task.add_done_callback(self._polls.discard)
+
+    async def _poll(self, client) -> None:
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(client)
+        if entry is None:
+            return
+
+        # a frame pushed since the last poll tells as much as the answer to a query
+        last_seen = client.health.last_seen
+        if last_seen is not None and last_seen != entry.seen and time.time() - last_seen < entry.interval:
+            entry.seen = last_seen
+            self.skipped += 1
+            self._schedule(client, loop.time() + self._jittered(entry.interval))
+            return
+
+        started = loop.time()
+        self.polls += 1
+        data = await client.async_query()
+        if self._clients.get(client) is not entry:
+            # disconnected meanwhile
+            return
+
+        if not data:
+            entry.failures += 1
+            if entry.failures >= MAX_FAILURES:
+                _LOGGER.debug('%s no answer to %d polls, reconnecting', client.ip, entry.failures)
+                self.remove(client)
+                client.reconnect()
+                return
+            self._schedule(client, loop.time() + self._min_interval)
+            return
+
+        entry.failures = 0
+        entry.seen = client.health.last_seen
+        if entry.touched_at is None or entry.touched_at < started:
+            entry.interval = min(self._max_interval, entry.interval * 2)
+        self._schedule(client, loop.time() + self._jittered(entry.interval))
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_LOGGER = logging.getLogger(__name__)
+# raw packets, enable with logger custom_components.hass_cozylife_local_pull.protocol.wire: debug
+_WIRE_LOGGER = logging.getLogger(__name__ + '.wire')
+
+"""
+CozyLife wire format: one json object per frame, frames end with \\r\\n
+tcp may split or merge frames at any byte, udp replies are one frame per datagram
+"""
+
+CMD_INFO = 0
+CMD_QUERY = 2
+CMD_SET = 3
+# state report the device sends on its own
+CMD_REPORT = 10
+
+DELIMITER = b'\r\n'
+MAX_FRAME_SIZE = 64 * 1024
+# msg of a CMD_INFO reply, tcp and udp discovery answer the same
+INFO_FIELDS = ('did', 'pid', 'mac', 'ip', 'dtp', 'rssi', 'sv', 'hv')
+
+# log 1 packet out of _wire_sample, 1 logs them all
+_wire_sample = 1
+_wire_count = 0
+
+
+def set_wire_sample(sample: int) -> None:
+    """
+    sample the wire trace, a busy lan at debug level writes thousands of lines a minute otherwise
+    :param sample: log 1 packet out of sample
+    :return:
+    """
+    global _wire_sample
+    _wire_sample = max(1, int(sample))
+
+
+def wire_trace(direction: str, ip: str, data: bytes) -> None:
+    """
+    debug trace of a raw packet, costs one level check when debug is off
+    :param direction: '>' sent, '<' received
+    :param ip:
+    :param data:
+    :return:
+    """
+    global _wire_count
+    if not _WIRE_LOGGER.isEnabledFor(logging.DEBUG):
+        return
+
+    _wire_count += 1
+    if _wire_count % _wire_sample:
+        return
+
+    _WIRE_LOGGER.debug('%s %s %r', ip, direction, data)
+
+
+# frames around the sn, key order as the devices document it
+_INFO_HEAD = b'{"pv":0,"cmd":0,"sn":"'
+_INFO_TAIL = b'","msg":{}}' + DELIMITER
+_QUERY_HEAD = b'{"pv":0,"cmd":2,"sn":"'
+_QUERY_TAIL = b'","msg":{"attr":[0]}}' + DELIMITER
+_SET_HEAD = b'{"pv":0,"cmd":3,"sn":"'
+_SET_ATTR = b'","msg":{"attr":['
+_SET_DATA = b'],"data":'
+_SET_TAIL = b'}}' + DELIMITER
+
+
+if orjson is not None:
+    def _json_dumps(data: dict) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def _json_dumps(data: dict) -> bytes:
+        return json.dumps(data, separators=(',', ':')).encode()
+
+
+def _dumps(data: dict) -> bytes:
+    # dpid -> int is all a device takes, formatted without a json encoder; anything else goes through one
+    parts = []
+    for key, value in data.items():
+        if type(value) is not int or type(key) is not str or not key.isdigit():
+            return _json_dumps(data)
+        parts.append(b'"%s":%d' % (key.encode(), value))
+
+    return b'{%s}' % b','.join(parts)
+
+
+class PacketEncoder(object):
+    """
+    encoder of the frames we send, one per connection
+    CMD_INFO and CMD_QUERY are templates around the sn, CMD_SET is assembled in a reused buffer
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def encode(self, cmd: int, sn: str, payload: dict) -> bytes:
+        """
+        package message
+        :param cmd:
+        :param sn:
+        :param payload: dpid -> value, CMD_SET only
+        :return: frame with its delimiter
+        """
+        if CMD_QUERY == cmd:
+            return b''.join((_QUERY_HEAD, sn.encode(), _QUERY_TAIL))
+
+        if CMD_SET == cmd:
+            buffer = self._buffer
+            del buffer[:]
+            buffer += _SET_HEAD
+            buffer += sn.encode()
+            buffer += _SET_ATTR
+            buffer += b','.join([b'%d' % int(key) for key in payload])
+            buffer += _SET_DATA
+            buffer += _dumps(payload)
+            buffer += _SET_TAIL
+            # the transport may keep what it is given until sent, so never hand it the buffer itself
+            return bytes(buffer)
+
+        if CMD_INFO == cmd:
+            return b''.join((_INFO_HEAD, sn.encode(), _INFO_TAIL))
+
+        raise Exception('CMD is not valid')
+
+
+if orjson is not None:
+    _json_loads = orjson.loads
+else:
+    def _json_loads(raw) -> dict:
+        # devices send utf-8, json.loads would detect the encoding of every frame
+        return json.loads(raw.decode())
+
+
+class Message(object):
+    """
+    a frame of the device, checked once where it is decoded
+    cmd: int or None
+    sn: str or None
+    res: result code of a reply, 0 is success
+    msg: dict, {} when missing
+    data: dpid -> value of msg.data, None when the frame carries no state
+    """
+    __slots__ = ('cmd', 'sn', 'res', 'msg', 'data')
+
+    def __init__(self, cmd: int = None, sn: str = None, res: int = None, msg: dict = None, data: dict = None):
+        self.cmd = cmd
+        self.sn = sn
+        self.res = res
+        self.msg = {} if msg is None else msg
+        self.data = data
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not Message:
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f'Message(cmd={self.cmd!r}, sn={self.sn!r}, res={self.res!r}, msg={self.msg!r})'
+
+
+def parse_message(frame) -> Message:
+    """
+    :param frame: decoded json
+    :return: Message or None when frame is not an object
+    """
+    if type(frame) is not dict:
+        return None
+
+    cmd = frame.get('cmd')
+    sn = frame.get('sn')
+    msg = frame.get('msg')
+    if type(msg) is not dict:
+        msg = {}
+    data = msg.get('data')
+    return Message(
+        cmd if type(cmd) is int else None,
+        sn if type(sn) is str else None,
+        frame.get('res'),
+        msg,
+        data if type(data) is dict else None,
+    )
+
+
+class FrameDecoder(object):
+    """
+    incremental decoder, feed() any chunk read from the socket and get back the complete frames
+    each frame is parsed once, into a Message
+    the buffer is only compacted once per feed and never rescanned from the start
+    """
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self._buffer = bytearray()
+        # bytes of _buffer already searched for a delimiter
+        self._scanned = 0
+        self._max_frame_size = max_frame_size
+        self.errors = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        bytes waiting for the rest of their frame
+        :return:
+        """
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> list:
+        """
+        :param data: chunk from recv
+        :return: list of Message
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        start = 0
+        # a delimiter may straddle the previous chunk
+        index = buffer.find(DELIMITER, max(self._scanned - 1, 0))
+        while index != -1:
+            self._decode(buffer[start:index], frames)
+            start = index + 2
+            index = buffer.find(DELIMITER, start)
+
+        if start:
+            # bytearray drops a prefix without moving the tail
+            del buffer[:start]
+
+        self._scanned = len(buffer)
+        if self._scanned > self._max_frame_size:
+            _LOGGER.warning('frame larger than %d bytes, dropped', self._max_frame_size)
+            self.errors += 1
+            self.reset()
+
+        return frames
+
+    def flush(self) -> list:
+        """
+        decode what is left in the buffer as a last frame without delimiter
+        :return:
+        """
+        frames = []
+        if self._buffer:
+            self._decode(self._buffer, frames)
+        self.reset()
+        return frames
+
+    def reset(self) -> None:
+        self._buffer.clear()
+        self._scanned = 0
+
+    def _decode(self, raw, frames: list) -> None:
+        if not raw or raw.isspace():
+            return
+
+        try:
+            message = parse_message(_json_loads(raw))
+        except ValueError:
+            _LOGGER.debug('frame is not json: %r', bytes(raw[:64]))
+            self.errors += 1
+            return
+
+        if message is None:
+            self.errors += 1
+            return
+
+        frames.append(message)
+
+
+def decode_datagram(data: bytes) -> list:
+    """
+    decode a udp datagram, the delimiter is optional there
+    :param data:
+    :return: list of Message
+    """
+    decoder = FrameDecoder()
+    return decoder.feed(data) + decoder.flush()
+
+
+def parse_info(message: Message) -> dict:
+    """
+    device record of a CMD_INFO reply
+    :param message:
+    :return: {'did', 'pid', 'mac', 'ip', 'dtp', 'rssi', 'sv', 'hv'} or None without did or pid
+    """
+    msg = message.msg
+    if msg.get('did') is None or msg.get('pid') is None:
+        return None
+
+    return {key: msg.get(key) for key in INFO_FIELDS}
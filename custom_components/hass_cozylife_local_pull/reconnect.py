@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+"""
+when to connect again, shared by every device so a router reboot does not reconnect 150 devices at once
+"""
+
+STATE_CONNECTING = 'connecting'
+STATE_CONNECTED = 'connected'
+STATE_BACKOFF = 'backoff'
+
+BASE_DELAY = 1
+MAX_DELAY = 300
+MAX_CONCURRENT_CONNECTS = 8
+# seconds a connection has to live before its device starts over at the base delay
+STABLE_AFTER = 60
+
+
+def backoff_delay(attempt: int, base: float = BASE_DELAY, cap: float = MAX_DELAY) -> float:
+    """
+    exponential backoff with full jitter
+    :param attempt: failed attempts in a row, from 0
+    :param base:
+    :param cap:
+    :return: seconds
+    """
+    return random.uniform(0, min(cap, base * 2 ** min(attempt, 32)))
+
+
+class ReconnectScheduler(object):
+    """
+    every device waits backoff_delay() after a failure, then takes one of max_concurrent connect slots
+    each device task owns its single pending attempt, the scheduler only paces and caps them
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_CONNECTS, base: float = BASE_DELAY,
+                 cap: float = MAX_DELAY):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._base = base
+        self._cap = cap
+        self._connecting = 0
+
+    @property
+    def connecting(self) -> int:
+        """
+        connects holding a slot right now
+        :return:
+        """
+        return self._connecting
+
+    def delay(self, attempt: int) -> float:
+        return backoff_delay(attempt, self._base, self._cap)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        self._connecting += 1
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self._connecting -= 1
+        self._semaphore.release()
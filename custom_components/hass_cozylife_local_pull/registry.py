@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import logging
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_KEY = f'{DOMAIN}.devices'
+STORAGE_VERSION = 1
+# seconds, coalesce the saves of a boot where every device reports in
+SAVE_DELAY = 10
+
+"""
+devices seen before, kept in .storage so entities exist before the lan answers
+record: {'did', 'pid', 'ip', 'type_code', 'model_name', 'icon', 'dpid'}
+"""
+
+
+class DeviceRegistry(object):
+
+    def __init__(self, hass: HomeAssistant):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        # did -> record
+        self._devices = {}
+
+    @property
+    def devices(self) -> dict:
+        return self._devices
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        if data is None or type(data.get('devices')) is not dict:
+            return
+
+        self._devices = data['devices']
+        _LOGGER.info('registry loaded %d devices', len(self._devices))
+
+    @callback
+    def async_update(self, record: dict) -> None:
+        """
+        store the record of a device that answered CMD_INFO
+        :param record:
+        :return:
+        """
+        if record.get('did') is None or self._devices.get(record['did']) == record:
+            return
+
+        self._devices[record['did']] = record
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def async_stale(self, did: str) -> None:
+        """
+        another device answers at the ip of did, keep the record but not its ip
+        :param did:
+        :return:
+        """
+        record = self._devices.get(did)
+        if record is None or record.get('ip') is None:
+            return
+
+        self._devices[did] = dict(record, ip=None)
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {'devices': self._devices}
@@ -0,0 +1,110 @@
+"""Platform for sensor integration."""
+from __future__ import annotations
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.const import UnitOfInformation, UnitOfTime
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
+from homeassistant.util import dt as dt_util
+from typing import Any
+from .const import (
+    DOMAIN,
+    SIGNAL_DEVICE_READY,
+)
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# key, name, unit, device class, state class, enabled by default
+HEALTH_SENSORS = [
+    ('rtt_avg', 'RTT', UnitOfTime.MILLISECONDS, None, SensorStateClass.MEASUREMENT, True),
+    ('last_seen', 'Last seen', None, SensorDeviceClass.TIMESTAMP, None, True),
+    ('timeouts', 'Timeouts', None, None, SensorStateClass.TOTAL_INCREASING, False),
+    ('reconnects', 'Reconnects', None, None, SensorStateClass.TOTAL_INCREASING, False),
+    ('bytes_in', 'Bytes in', UnitOfInformation.BYTES, SensorDeviceClass.DATA_SIZE,
+     SensorStateClass.TOTAL_INCREASING, False),
+    ('bytes_out', 'Bytes out', UnitOfInformation.BYTES, SensorDeviceClass.DATA_SIZE,
+     SensorStateClass.TOTAL_INCREASING, False),
+]
+
+
+async def async_setup_platform(
+    hass: HomeAssistant,
+    config: ConfigType,
+    async_add_entities: AddEntitiesCallback,
+    discovery_info: DiscoveryInfoType | None = None
+) -> None:
+    """Set up the diagnostic sensors, one set per device."""
+    if discovery_info is None:
+        return
+
+    # did with sensors, a device is announced again once its type code is known
+    added = set()
+    sensors = []
+    for item in hass.data[DOMAIN]['devices'].values():
+        added.add(item.device_id)
+        sensors += [CozyLifeHealthSensor(item, *description) for description in HEALTH_SENSORS]
+
+    async_add_entities(sensors)
+
+    @callback
+    def device_ready(item) -> None:
+        """Add the sensors of a device that answered CMD_INFO after setup."""
+        if item.device_id in added:
+            return
+        added.add(item.device_id)
+        async_add_entities([CozyLifeHealthSensor(item, *description) for description in HEALTH_SENSORS])
+
+    async_dispatcher_connect(hass, SIGNAL_DEVICE_READY, device_ready)
+
+
+class CozyLifeHealthSensor(SensorEntity):
+    """Connection health of a device, read from memory on every poll."""
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, tcp_client, key: str, name: str, unit: str | None, device_class: str | None,
+                 state_class: str | None, enabled: bool) -> None:
+        """Initialize the sensor."""
+        self._tcp_client = tcp_client
+        self._key = key
+        self._attr_unique_id = f'{tcp_client.device_id}_{key}'
+        self._name = name
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
+        self._attr_entity_registry_enabled_default = enabled
+
+    @property
+    def name(self) -> str:
+        """Return the name, the did until the catalogue knows the model."""
+        if self._tcp_client.device_model_name is None:
+            return f'{self._tcp_client.device_id} {self._name}'
+        return f'{self._tcp_client.device_model_name} {self._tcp_client.device_id[-4:]} {self._name}'
+
+    @property
+    def native_value(self) -> Any:
+        """Return the current value of the health counter."""
+        value = getattr(self._tcp_client.health, self._key)
+        if 'last_seen' == self._key and value is not None:
+            return dt_util.utc_from_timestamp(value)
+
+        if 'rtt_avg' == self._key and value is not None:
+            return round(value, 1)
+
+        return value
+
+    @property
+    def extra_state_attributes(self) -> dict | None:
+        """Return the rtt histogram next to the average."""
+        if 'rtt_avg' != self._key:
+            return None
+
+        health = self._tcp_client.health
+        return {'rtt_last': health.rtt_last, 'histogram': health.rtt_histogram}
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from typing import Iterable, Optional
+from .const import (
+    SWITCH,
+    WORK_MODE,
+    TEMP,
+    BRIGHT,
+    HUE,
+    SAT,
+)
+
+"""
+device dpid values <-> home assistant units, shared by the entities and the services
+brightness 0..1000 <-> 0..255, temp 0..1000 <-> 500..0 mireds, hue 0..360, sat 0..1000 <-> 0..100
+"""
+
+
+def _on_to_ha(value) -> bool:
+    return 0 != value
+
+
+def _on_to_device(value) -> int:
+    return 255 if value else 0
+
+
+def _brightness_to_ha(value) -> int:
+    return int(value / 4)
+
+
+def _brightness_to_device(value) -> int:
+    return max(0, min(1000, int(value * 4)))
+
+
+def _color_temp_to_ha(value) -> int:
+    return 500 - int(value / 2)
+
+
+def _color_temp_to_device(value) -> int:
+    return max(0, min(1000, int(1000 - value * 2)))
+
+
+def _saturation_to_ha(value) -> int:
+    return int(value / 10)
+
+
+def _saturation_to_device(value) -> int:
+    return max(0, min(1000, int(value * 10)))
+
+
+# dpid -> (field, to home assistant, to device)
+DPID_FIELDS = {
+    SWITCH: ('on', _on_to_ha, _on_to_device),
+    WORK_MODE: ('work_mode', int, int),
+    TEMP: ('color_temp', _color_temp_to_ha, _color_temp_to_device),
+    BRIGHT: ('brightness', _brightness_to_ha, _brightness_to_device),
+    HUE: ('hue', int, int),
+    SAT: ('saturation', _saturation_to_ha, _saturation_to_device),
+}
+# field -> (dpid, to device)
+FIELD_DPID = {field: (dpid, to_device) for dpid, (field, _, to_device) in DPID_FIELDS.items()}
+
+
+class DeviceState(object):
+    """
+    state of a device in home assistant units, None until the device reported the dpid
+    """
+    __slots__ = tuple(field for field, _, _ in DPID_FIELDS.values())
+
+    def __init__(self, data: Optional[dict] = None):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        if data:
+            self.update(data)
+
+    @property
+    def hs_color(self) -> Optional[tuple]:
+        if self.hue is None:
+            return None
+        return self.hue, self.saturation if self.saturation is not None else 0
+
+    def update(self, data: dict) -> bool:
+        """
+        convert the dpid values the device sent
+        :param data: dpid -> value, unknown dpid are ignored
+        :return: a known dpid was in data
+        """
+        updated = False
+        for key, value in data.items():
+            entry = DPID_FIELDS.get(key)
+            if entry is None:
+                continue
+            # None: the value was rolled back to unknown
+            if value is None:
+                setattr(self, entry[0], None)
+            elif type(value) is int:
+                setattr(self, entry[0], entry[1](value))
+            else:
+                continue
+            updated = True
+
+        return updated
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+def to_payload(fields: dict) -> dict:
+    """
+    dpid payload of home assistant values
+    :param fields: field -> value, None values are left out, hs_color is split into hue and saturation
+    :return:
+    """
+    if fields.get('hs_color') is not None:
+        fields = dict(fields, hue=fields['hs_color'][0], saturation=fields['hs_color'][1])
+
+    payload = {}
+    for field, value in fields.items():
+        entry = FIELD_DPID.get(field)
+        if entry is None or value is None:
+            continue
+        payload[entry[0]] = entry[1](value)
+
+    return payload
+
+
+def to_states(datas: Iterable[dict]) -> list:
+    """
+    convert the state of many devices at once, for snapshots of a whole install
+    :param datas: dpid -> value of every device
+    :return: list of DeviceState, same order
+    """
+    return [DeviceState(data) for data in datas]
@@ -3,12 +3,14 @@ from __future__ import annotations
 
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.components.switch import SwitchEntity
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from typing import Any, Final, Literal, TypedDict, final
 from .const import (
     DOMAIN,
+    SIGNAL_DEVICE_READY,
     SWITCH_TYPE_CODE,
     LIGHT_TYPE_CODE,
     LIGHT_DPID,
@@ -19,51 +21,78 @@ from .const import (
     HUE,
     SAT,
 )
+from .channel import DeviceChannel
+from .state import DeviceState, to_payload
 import logging
 
 _LOGGER = logging.getLogger(__name__)
-_LOGGER.info('switch')
 
 
-def setup_platform(
+async def async_setup_platform(
     hass: HomeAssistant,
     config: ConfigType,
-    add_entities: AddEntitiesCallback,
+    async_add_entities: AddEntitiesCallback,
     discovery_info: DiscoveryInfoType | None = None
 ) -> None:
     """Set up the sensor platform."""
     # We only want this platform to be set up via discovery.
-    # logging.info('setup_platform', hass, config, add_entities, discovery_info)
-    _LOGGER.info('setup_platform')
-    _LOGGER.info(f'ip={hass.data[DOMAIN]}')
     
     if discovery_info is None:
         return
 
 
+    channels = hass.data[DOMAIN]['channels']
     switchs = []
-    for item in hass.data[DOMAIN]['tcp_client']:
+    for item in hass.data[DOMAIN]['devices'].values():
         if SWITCH_TYPE_CODE == item.device_type_code:
-            switchs.append(CozyLifeSwitch(item))
+            switchs += [CozyLifeSwitch(channel) for channel in channels.get(item.device_id, [])]
     
-    add_entities(switchs)
+    async_add_entities(switchs)
+    
+    @callback
+    def device_ready(item) -> None:
+        """Add the entities of a device that answered CMD_INFO after setup, one per gang."""
+        if SWITCH_TYPE_CODE == item.device_type_code:
+            async_add_entities([CozyLifeSwitch(channel) for channel in channels.get(item.device_id, [])])
+    
+    async_dispatcher_connect(hass, SIGNAL_DEVICE_READY, device_ready)
 
 
 class CozyLifeSwitch(SwitchEntity):
-    _tcp_client = None
+    _channel = None
     _attr_is_on = True
+    # state is pushed from the device state cache
+    _attr_should_poll = False
     
-    def __init__(self, tcp_client) -> None:
+    def __init__(self, channel: DeviceChannel) -> None:
         """Initialize the sensor."""
-        _LOGGER.info('__init__')
-        self._tcp_client = tcp_client
-        self._unique_id = tcp_client.device_id
-        self._name = tcp_client.device_model_name + ' ' + tcp_client.device_id[-4:]
+        self._channel = channel
+        self._unique_id = channel.unique_id
+        self._name = channel.name
+        self._state = DeviceState(channel.state)
+        self._refresh_state()
+    
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the device state cache."""
+        self.async_on_remove(self._channel.add_listener(self._handle_state_update))
+    
+    @callback
+    def _handle_state_update(self, changed: dict) -> None:
+        """Device pushed new state."""
+        self._state.update(changed)
+        self._refresh_state()
+        self.async_write_ha_state()
+    
+    async def async_update(self) -> None:
+        """Query the device, the reply lands in the state cache."""
+        await self._channel.async_query()
         self._refresh_state()
     
     def _refresh_state(self):
-        self._state = self._tcp_client.query()
-        self._attr_is_on = 0 != self._state['1']
+        if self._state.on is None:
+            return
+        
+        self._attr_is_on = self._state.on
     
     @property
     def name(self) -> str:
@@ -72,14 +101,11 @@ class CozyLifeSwitch(SwitchEntity):
     @property
     def available(self) -> bool:
         """Return if the device is available."""
-        return True
+        return self._channel.available
     
     @property
     def is_on(self) -> bool:
         """Return True if entity is on."""
-        self._attr_is_on = True
-
-        self._refresh_state()
         return self._attr_is_on
     
     @property
@@ -87,19 +113,19 @@ class CozyLifeSwitch(SwitchEntity):
         """Return a unique ID."""
         return self._unique_id
     
-    def turn_on(self, **kwargs: Any) -> None:
+    async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the entity on."""
         self._attr_is_on = True
-        _LOGGER.info(f'turn_on:{kwargs}')
-        self._tcp_client.control({'1': 255})
+        _LOGGER.debug('%s turn_on %s', self._unique_id, kwargs)
+        await self._channel.async_control(to_payload({'on': True}))
         return None
         raise NotImplementedError()
     
-    def turn_off(self, **kwargs: Any) -> None:
+    async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn the entity off."""
         self._attr_is_on = False
-        _LOGGER.info('turn_off')
-        self._tcp_client.control({'1': 0})
+        _LOGGER.debug('%s turn_off', self._unique_id)
+        await self._channel.async_control(to_payload({'on': False}))
         return None
         
         raise NotImplementedError()
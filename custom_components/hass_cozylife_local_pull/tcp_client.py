@@ -1,15 +1,16 @@
 # -*- coding: utf-8 -*-
-import json
+import errno
 import socket
-import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import partial
 from typing import Optional, Union, Any
 import logging
-from .utils import get_pid_list, get_sn
-import threading
+from .utils import get_pid_info, get_pid_list, sn_generator
+from .protocol import CMD_INFO, CMD_QUERY, CMD_SET, FrameDecoder, Message, PacketEncoder, \
+    parse_info, wire_trace
+from .reconnect import backoff_delay
+from .io_loop import IOLoop, default_loop
 
-CMD_INFO = 0
-CMD_QUERY = 2
-CMD_SET = 3
 CMD_LIST = [CMD_INFO, CMD_QUERY, CMD_SET]
 _LOGGER = logging.getLogger(__name__)
 
@@ -17,6 +18,10 @@ _LOGGER = logging.getLogger(__name__)
 class tcp_client(object):
     """
     Represents a device
+    every tcp_client is served by one shared io_loop.IOLoop thread, no thread and no blocking read per device
+    query_future() / control_future() return concurrent futures, query() / control() wait for them
+    a reply not there within _timeout drops the connection, the next calls return at once until it is back
+    close() drops the connection for good, calls after it or after the loop stopped return at once
     send:{"cmd":0,"pv":0,"sn":"1636463553873","msg":{}}
     receiver:{"cmd":0,"pv":0,"sn":"1636463553873","msg":{"did":"629168597cb94c4c1d8f","dtp":"02","pid":"e2s64v",
     "mac":"7cb94c4c1d8f","ip":"192.168.123.57","rssi":-33,"sv":"1.0.0","hv":"0.0.1"},"res":0}
@@ -32,6 +37,7 @@ class tcp_client(object):
     """
     _ip = str
     _port = 5555
+    _timeout = 3
     _connect = socket
     
     _device_id = str
@@ -44,38 +50,164 @@ class tcp_client(object):
     # last sn
     _sn = str
     
-    def __init__(self, ip):
+    def __init__(self, ip, info: Optional[dict] = None, io_loop: Optional[IOLoop] = None):
+        """
+        :param ip:
+        :param info: udp_discover.get_devices record of this ip, replaces the CMD_INFO handshake
+        :param io_loop: default the loop shared by every tcp_client
+        """
         self._ip = ip
-        self._connect = None  # Initialize _connect as None
-        self._close_connection() 
-        self._reconnect()
+        self._info = info
+        # may download the product list, here on the caller's thread rather than on the shared loop
+        get_pid_list()
+        self._loop = io_loop if io_loop is not None else default_loop()
+        # everything below belongs to the loop thread
+        self._connect = None
+        # connected and device info applied
+        self._ready = False
+        self._attempt = 0
+        self._holds_slot = False
+        # timer of the pending connect, handshake or reconnect
+        self._timer = None
+        self._decoder = FrameDecoder()
+        self._sn_generator = sn_generator()
+        self._encoder = PacketEncoder()
+        # bytes the socket did not take yet
+        self._out = bytearray()
+        # sn -> (future, timer) of every request waiting for its reply
+        self._inflight = {}
+        # sn of the CMD_INFO handshake
+        self._info_sn = None
+        # set by close(), from any thread
+        self._closed = False
+        self._loop.call_soon(self._start_connect)
+
+    def close(self) -> None:
+        """
+        close the connection and stop reconnecting, from any thread
+        :return:
+        """
+        self._closed = True
+        if self._loop.stopped:
+            # nothing runs on the loop any more, just let go of the socket
+            if self._connect is not None:
+                self._connect.close()
+            return
+        if self._loop.in_loop():
+            self._close_connection()
+        else:
+            self._loop.call_soon(self._close_connection)
     
     def _close_connection(self):
+        """
+        loop thread, the waiting requests get no reply
+        :return:
+        """
+        self._ready = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
         if self._connect:
             try:
+                self._loop.remove_reader(self._connect)
+                self._loop.remove_writer(self._connect)
                 self._connect.close()
             except Exception as e:
-                _LOGGER.error(f'Error while closing the connection: {e}')
+                _LOGGER.warning('%s error while closing the connection: %s', self._ip, e)
             self._connect = None
+        self._out.clear()
+        self._info_sn = None
+        if self._holds_slot:
+            self._holds_slot = False
+            self._loop.release_connect()
+        inflight, self._inflight = self._inflight, {}
+        for future, timer in inflight.values():
+            timer.cancel()
+            future.set_result(None)
+    
+    def _reconnect(self, reason: Any = None):
+        """
+        close and connect again after backoff_delay, loop thread
+        :return:
+        """
+        self._close_connection()
+        if self._closed:
+            return
+        delay = backoff_delay(self._attempt)
+        self._attempt += 1
+        _LOGGER.log(logging.DEBUG if self._attempt > 1 else logging.INFO,
+                    '%s reconnection failed: %s, retry in %.1fs', self._ip, reason, delay)
+        self._timer = self._loop.call_later(delay, self._start_connect)
+    
+    def _start_connect(self) -> None:
+        self._timer = None
+        if self._closed:
+            return
+        if not self._holds_slot:
+            if not self._loop.acquire_connect(self._slot_ready):
+                return
+            self._holds_slot = True
         
-    def _reconnect(self):
-        def reconnect_thread():            
-            while True:
-                try:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.settimeout(3)
-                    s.connect((self._ip, self._port))
-                    self._connect = s
-                    self._device_info()
-                    return
-                except Exception as e:
-                    _LOGGER.info(f'Reconnection failed: {e}')
-                    time.sleep(60)  # Wait for 60 seconds before trying to reconnect
+        s = None
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setblocking(False)
+            err = s.connect_ex((self._ip, self._port))
+        except OSError as e:
+            # out of sockets or a bad address, _reconnect hands the slot back
+            if s is not None:
+                s.close()
+            self._reconnect(e)
+            return
 
-        thread = threading.Thread(target=reconnect_thread)
-        thread.daemon = True  # This makes the thread exit when the main program exits
-        thread.start()
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            s.close()
+            self._reconnect(OSError(err, errno.errorcode.get(err, 'connect error')))
+            return
+        
+        self._connect = s
+        self._loop.add_writer(s, partial(self._on_connected, s))
+        self._timer = self._loop.call_later(self._timeout, self._reconnect, 'timeout')
+    
+    def _slot_ready(self) -> None:
+        # a slot freed up, it is ours
+        self._holds_slot = True
+        if self._closed:
+            self._holds_slot = False
+            self._loop.release_connect()
+            return
+        self._start_connect()
+    
+    def _on_connected(self, s: socket.socket) -> None:
+        if s is not self._connect:
+            return
+        self._loop.remove_writer(s)
+        err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self._reconnect(OSError(err, errno.errorcode.get(err, 'connect error')))
+            return
+        
+        self._decoder.reset()
+        self._sn_generator = sn_generator()
+        self._loop.add_reader(s, partial(self._on_readable, s))
+        if self._info is not None and self._info.get('did') is not None:
+            self._apply_info(self._info)
+            self._connected()
+        else:
+            self._device_info()
+    
+    def _connected(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._ready = True
+        if self._holds_slot:
+            self._holds_slot = False
+            self._loop.release_connect()
 
+    @property
+    def available(self) -> bool:
+        return self._ready
 
     @property
     def check(self) -> bool:
@@ -107,56 +239,28 @@ class tcp_client(object):
     
     def _device_info(self) -> None:
         """
-        get info for device model
+        get info for device model, the answer is picked up by _on_frame
         :return:
         """
-        self._only_send(CMD_INFO, {})
-        try:
-            resp = self._connect.recv(1024)
-            resp_json = json.loads(resp.strip())            
-        except:
-            _LOGGER.info('_device_info.recv.error')
-            return None
-        
-        if resp_json.get('msg') is None or type(resp_json['msg']) is not dict:
-            _LOGGER.info('_device_info.recv.error1')
-            
-            return None
-        
-        if resp_json['msg'].get('did') is None:
-            _LOGGER.info('_device_info.recv.error2')
-            
-            return None
-
-        self._device_id = resp_json['msg']['did']
-        
-        if resp_json['msg'].get('pid') is None:
-            _LOGGER.info('_device_info.recv.error3')
-            return None
-        
-        self._pid = resp_json['msg']['pid']        
-        pid_list = get_pid_list()
-
-        for item in pid_list:
-            match = False
-            for item1 in item['m']:
-                if item1['pid'] == self._pid:
-                    match = True
-                    self._icon = item1['i']
-                    self._device_model_name = item1['n']
-                    self._dpid = item1['dpid']
-                    break
-            
-            if match:
-                self._device_type_code = item['c']                
-                break
+        self._info_sn = self._only_send(CMD_INFO, {})
+    
+    def _apply_info(self, info: dict) -> None:
+        """
+        set device model from a CMD_INFO or discovery record
+        :param info:
+        :return:
+        """
+        self._device_id = info['did']
+        self._pid = info['pid']
+        model = get_pid_info(self._pid)
+        if model:
+            self._icon = model['i']
+            self._device_model_name = model['n']
+            self._dpid = model['dpid']
+            self._device_type_code = model['c']
         
-        # _LOGGER.info(pid_list)
-        _LOGGER.info(self._device_id)
-        _LOGGER.info(self._device_type_code)
-        _LOGGER.info(self._pid)
-        _LOGGER.info(self._device_model_name)
-        _LOGGER.info(self._icon)
+        _LOGGER.debug('%s device_id=%s,pid=%s,type_code=%s,model=%s', self._ip, self._device_id, self._pid,
+                      self._device_type_code, self._device_model_name)
     
     def _get_package(self, cmd: int, payload: dict) -> bytes:
         """
@@ -165,83 +269,172 @@ class tcp_client(object):
         :param payload:
         :return:
         """
-        self._sn = get_sn()
-        if CMD_SET == cmd:
-            message = {
-                'pv': 0,
-                'cmd': cmd,
-                'sn': self._sn,
-                'msg': {
-                    'attr': [int(item) for item in payload.keys()],
-                    'data': payload,
-                }
-            }
-        elif CMD_QUERY == cmd:
-            message = {
-                'pv': 0,
-                'cmd': cmd,
-                'sn': self._sn,
-                'msg': {
-                    'attr': [0],
-                }
-            }
-        elif CMD_INFO == cmd:
-            message = {
-                'pv': 0,
-                'cmd': cmd,
-                'sn': self._sn,
-                'msg': {}
-            }
-        else:
-            raise Exception('CMD is not valid')
+        self._sn = next(self._sn_generator)
+        package = self._encoder.encode(cmd, self._sn, payload)
+        wire_trace('>', self._ip, package)
+        return package
+    
+    def _on_readable(self, s: socket.socket) -> None:
+        """
+        every whole frame of what the socket has, frames may span or share recv chunks
+        :param s:
+        :return:
+        """
+        if s is not self._connect:
+            return
+        try:
+            data = s.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._reconnect(e)
+            return
+        if not data:
+            self._reconnect('connection closed by device')
+            return
+        
+        wire_trace('<', self._ip, data)
+        for message in self._decoder.feed(data):
+            self._on_frame(message)
+            if s is not self._connect:
+                return
+    
+    def _on_frame(self, message: Message) -> None:
+        """
+        route a frame to its waiter by sn, reports have none
+        :param message:
+        :return:
+        """
+        if self._info_sn is not None:
+            if self._info_sn != message.sn:
+                return
+            self._info_sn = None
+            info = parse_info(message)
+            if info is None:
+                self._reconnect(f'_device_info.recv.error: {message}')
+                return
+            self._attempt = 0
+            self._apply_info(info)
+            self._connected()
+            return
         
-        payload_str = json.dumps(message, separators=(',', ':',))
-        _LOGGER.info(f'_package={payload_str}')
-        return bytes(payload_str + "\r\n", encoding='utf8')
+        waiter = self._inflight.pop(message.sn, None)
+        if waiter is not None:
+            # the device answers, a device that only accepts connections keeps backing off
+            self._attempt = 0
+            waiter[1].cancel()
+            waiter[0].set_result(message)
     
-    def _send_receiver(self, cmd: int, payload: dict) -> Union[dict, Any]:
+    def _only_send(self, cmd: int, payload: dict) -> str:
         """
-        send & receiver
+        send but not receiver, loop thread
         :param cmd:
         :param payload:
+        :return: sn of the message
+        """
+        self._out += self._get_package(cmd, payload)
+        self._flush()
+        return self._sn
+    
+    def _flush(self) -> None:
+        """
+        write what the socket takes, wait for it to be writable for the rest
         :return:
         """
-        self._connect.send(self._get_package(cmd, payload))
+        s = self._connect
+        if s is None or not self._out:
+            return
         try:
-            i = 10
-            while i > 0:
-                res = self._connect.recv(1024)
-                # print(f'res={res},sn={self._sn},{self._sn in str(res)}')
-                i -= 1
-                #only allow same sn
-                if self._sn in str(res):
-                    payload = json.loads(res.strip())
-                    if payload is None or len(payload) == 0:
-                        return {}
-
-                    if payload.get('msg') is None or type(payload['msg']) is not dict:
-                        return {}
-
-                    if payload['msg'].get('data') is None or type(payload['msg']['data']) is not dict:
-                        return {}
-
-                    return payload['msg']['data']
-
-            return {}
-
-        except Exception as e:
-            _LOGGER.info(f'_only_send.recv.error: {e}')
-            self._reconnect()  # Reconnect on exception
-            return {}
+            sent = s.send(self._out)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError as e:
+            self._reconnect(e)
+            return
+        del self._out[:sent]
+        if self._out:
+            self._loop.add_writer(s, partial(self._on_writable, s))
+    
+    def _on_writable(self, s: socket.socket) -> None:
+        if s is not self._connect:
+            return
+        self._loop.remove_writer(s)
+        self._flush()
     
-    def _only_send(self, cmd: int, payload: dict) -> None:
+    def _submit(self, cmd: int, payload: dict, future: Future, wait: bool) -> None:
         """
-        send but not receiver
+        loop thread side of query_future & control_future
         :param cmd:
         :param payload:
+        :param future:
+        :param wait: resolve with the reply, else once the frame is written
         :return:
         """
-        self._connect.send(self._get_package(cmd, payload))
+        if not self._ready:
+            future.set_result(None)
+            return
+        
+        sn = self._only_send(cmd, payload)
+        if not wait:
+            future.set_result(self._ready)
+            return
+        if not self._ready:
+            future.set_result(None)
+            return
+        self._inflight[sn] = (future, self._loop.call_later(self._timeout, self._reply_timeout, sn))
+    
+    def _reply_timeout(self, sn: str) -> None:
+        waiter = self._inflight.pop(sn, None)
+        if waiter is None:
+            return
+        _LOGGER.debug('%s query.recv.timeout: sn=%s', self._ip, sn)
+        waiter[0].set_result(None)
+        # Reconnect on timeout, a dead device answers the next calls at once
+        self._reconnect('timeout')
+    
+    def _request(self, cmd: int, payload: dict, wait: bool) -> Future:
+        future = Future()
+        if self._closed or self._loop.stopped:
+            # no loop left to answer it
+            future.set_result(None)
+            return future
+        if self._loop.in_loop():
+            self._submit(cmd, payload, future, wait)
+        else:
+            self._loop.call_soon(self._submit, cmd, payload, future, wait)
+        return future
+    
+    def _result(self, future: Future) -> Any:
+        try:
+            # the loop resolves it within _timeout, the margin covers a busy loop
+            return future.result(self._timeout + 1)
+        except FutureTimeoutError:
+            return None
+    
+    def control_future(self, payload: dict) -> Future:
+        """
+        control use dpid
+        :param payload:
+        :return: future of True once the frame is written, False when not connected
+        """
+        future = Future()
+        self._request(CMD_SET, payload, False).add_done_callback(
+            lambda done: future.set_result(bool(done.result())))
+        return future
+    
+    def query_future(self) -> Future:
+        """
+        query device state
+        :return: future of msg.data of the reply, {} without one
+        """
+        future = Future()
+        
+        def done(reply: Future) -> None:
+            message = reply.result()
+            future.set_result(message.data if message is not None and message.data is not None else {})
+        
+        self._request(CMD_QUERY, {}, True).add_done_callback(done)
+        return future
     
     def control(self, payload: dict) -> bool:
         """
@@ -249,12 +442,11 @@ class tcp_client(object):
         :param payload:
         :return:
         """
-        self._only_send(CMD_SET, payload)
-        return True
+        return bool(self._result(self.control_future(payload)))
     
     def query(self) -> dict:
         """
         query device state
         :return:
         """
-        return self._send_receiver(CMD_QUERY, {})
\ No newline at end of file
+        return self._result(self.query_future()) or {}
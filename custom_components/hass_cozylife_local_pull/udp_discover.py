@@ -1,6 +1,9 @@
+import asyncio
 import socket
 import time
+from typing import Callable, Optional
 from .utils import get_sn
+from .protocol import INFO_FIELDS, decode_datagram, parse_info
 import logging
 
 
@@ -10,12 +13,44 @@ _LOGGER = logging.getLogger(__name__)
 discover device
 """
 
+DISCOVER_PORT = 6095
+BROADCAST_ADDRESS = '255.255.255.255'
+
+EVENT_ADD = 'add'
+EVENT_IP_CHANGED = 'ip_changed'
+EVENT_DISAPPEAR = 'disappear'
+
+
+def parse_reply(data: bytes, ip: str) -> Optional[dict]:
+    """
+    device record of a discovery reply, same fields as protocol.parse_info
+    did and pid are None for firmware that does not send them
+    :param data:
+    :param ip: sender of the reply, trusted over the ip the device reports
+    :return: record or None when it is not a CozyLife reply
+    """
+    frames = decode_datagram(data)
+    if not frames:
+        return None
+
+    record = parse_info(frames[0]) or dict.fromkeys(INFO_FIELDS)
+    record['ip'] = ip
+    return record
+
 
 def get_ip() -> list:
     """
     get device ip
     :return: list
     """
+    return [item['ip'] for item in get_devices()]
+
+
+def get_devices() -> list:
+    """
+    get device records, a tcp_client built with one skips the CMD_INFO handshake
+    :return: list
+    """
     server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
     
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -26,13 +61,12 @@ def get_ip() -> list:
     # Set a timeout so the socket does not block
     # indefinitely when trying to receive data.
     server.settimeout(0.1)
-    socket.setdefaulttimeout(0.1)
     message = '{"cmd":0,"pv":0,"sn":"' + get_sn() + '","msg":{}}'
     
     i = 0
     while i < 3:
         # server.sendto(bytes(message, encoding='utf-8'), ('<broadcast>', 6095))
-        server.sendto(bytes(message, encoding='utf-8'), ('255.255.255.255', 6095))
+        server.sendto(bytes(message, encoding='utf-8'), (BROADCAST_ADDRESS, DISCOVER_PORT))
         time.sleep(0.03)
         i += 1
 
@@ -44,24 +78,152 @@ def get_ip() -> list:
         try:
             data, addr = server.recvfrom(1024, socket.MSG_PEEK)
         except Exception as err:
-            _LOGGER.info(f'{i}/{max} try, udp timeout')
+            _LOGGER.debug('%d/%d try, udp timeout', i, max)
             continue
-        _LOGGER.info(f'first udp.receiver:{addr[0]}')
+        _LOGGER.debug('first udp.receiver:%s', addr[0])
         break
     else:
         _LOGGER.warning('cannot find any device')
         return []
     
     i = 255
-    ip = []
+    devices = {}
     while i > 0:
         try:
             data, addr = server.recvfrom(1024)
         except:
-            _LOGGER.info('udp timeout')
+            _LOGGER.debug('udp timeout')
             break
-        _LOGGER.info(f'udp.receiver:{addr[0]}')
-        if addr[0] not in ip: ip.append(addr[0])
         i -= 1
+        record = parse_reply(data, addr[0])
+        if record is None:
+            _LOGGER.debug('udp.receiver:%s sent no CozyLife frame', addr[0])
+            continue
+        _LOGGER.debug('udp.receiver:%s', addr[0])
+        devices.setdefault(addr[0], record)
     
-    return ip
+    return list(devices.values())
+
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, service: 'DiscoveryService'):
+        self._service = service
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self._service._handle_reply(data, addr[0])
+
+    def error_received(self, exc: Exception) -> None:
+        _LOGGER.debug('udp.error: %s', exc)
+
+
+class DiscoveryService(object):
+    """
+    broadcast {"cmd":0} on a backoff schedule from _min_interval to _max_interval seconds
+    on_event(event, record) is called with EVENT_ADD, EVENT_IP_CHANGED or EVENT_DISAPPEAR
+    and the parse_reply record of the device
+    a device missing _missed_rounds broadcasts in a row has disappeared
+    trigger() broadcasts at once, e.g. when a connection to a device was lost
+    """
+    _min_interval = 2
+    _max_interval = 300
+    _missed_rounds = 3
+    # one broadcast round is a burst, udp may be lost
+    _burst = 3
+    _burst_gap = 0.03
+
+    def __init__(self, on_event: Callable[[str, dict], None], broadcast_address: str = BROADCAST_ADDRESS):
+        self._on_event = on_event
+        self._broadcast_address = broadcast_address
+        self._transport = None
+        self._task = None
+        self._wakeup = None
+        self._interval = self._min_interval
+        self._round = 0
+        # did (ip without did) -> record
+        self._devices = {}
+        # did -> last round it answered
+        self._last_seen = {}
+
+    @property
+    def devices(self) -> dict:
+        return self._devices
+
+    async def async_start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DiscoveryProtocol(self), local_addr=('0.0.0.0', 0), allow_broadcast=True)
+        self._task = loop.create_task(self._run())
+
+    async def async_stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def trigger(self) -> None:
+        """
+        broadcast now and restart the backoff
+        :return:
+        """
+        self._interval = self._min_interval
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._round += 1
+            message = bytes('{"cmd":0,"pv":0,"sn":"' + get_sn() + '","msg":{}}', encoding='utf-8')
+            for _ in range(self._burst):
+                self._transport.sendto(message, (self._broadcast_address, DISCOVER_PORT))
+                await asyncio.sleep(self._burst_gap)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._interval)
+            except asyncio.TimeoutError:
+                self._interval = min(self._interval * 2, self._max_interval)
+
+            self._expire()
+
+    def _expire(self) -> None:
+        for did, last_seen in list(self._last_seen.items()):
+            if self._round - last_seen < self._missed_rounds:
+                continue
+
+            record = self._devices.pop(did)
+            del self._last_seen[did]
+            _LOGGER.info('udp.disappear:%s %s', did, record['ip'])
+            self._on_event(EVENT_DISAPPEAR, record)
+
+    def _handle_reply(self, data: bytes, ip: str) -> None:
+        record = parse_reply(data, ip)
+        if record is None:
+            return
+
+        # older firmware without did in the reply is tracked by ip
+        did = record['did'] if record['did'] is not None else ip
+        self._last_seen[did] = self._round
+
+        old = self._devices.get(did)
+        self._devices[did] = record
+        if old is not None and old['ip'] == ip:
+            return
+
+        if old is None:
+            _LOGGER.info('udp.add:%s %s', did, ip)
+            self._on_event(EVENT_ADD, record)
+        else:
+            _LOGGER.info('udp.ip_changed:%s %s -> %s', did, old['ip'], ip)
+            self._on_event(EVENT_IP_CHANGED, record)
+
+        # something moved on the lan, look again soon
+        self._interval = self._min_interval
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
+import itertools
 import json
 import time
-import requests
+from typing import Iterator
 import logging
 from .const import (
     API_DOMAIN,
@@ -18,48 +19,112 @@ def get_sn() -> str:
     return str(int(round(time.time() * 1000)))
 
 
+def sn_generator() -> Iterator[str]:
+    """
+    message sn for one connection, starts at get_sn() and counts up so two messages never share a sn
+    :return: Iterator[str]
+    """
+    return map(str, itertools.count(int(get_sn())))
+
+
 # cache get_pid_list result for many calls
 _CACHE_PID = []
+# pid -> {'c': type code, 'i': icon, 'n': model name, 'dpid': []}, built from _CACHE_PID
+_PID_INDEX = {}
 
 
-def get_pid_list(lang='en') -> list:
+def fetch_pid_list(lang='en', etag: str = None) -> tuple:
     """
     http://doc.doit/project-12/doc-95/
     :param lang:
-    :return:
+    :param etag: of the list we have, the server answers 304 when it did not change
+    :return: (pid_list, etag), (None, etag) when not modified, (None, None) on error
     """
-    global _CACHE_PID
-    if len(_CACHE_PID) != 0:
-        return _CACHE_PID
-    
     if lang not in ['zh', 'en', 'es', 'pt', 'ja', 'ru', 'pt', 'nl', 'ko', 'fr', 'de',]:
-        _LOGGER.info(f'not support lang={lang}, will set lang={LANG}')
+        _LOGGER.warning('not support lang=%s, will set lang=%s', lang, LANG)
         lang = LANG
 
-    res = requests.get(f'http://{API_DOMAIN}/api/v2/device_product/model', {
-        'lang': lang
-    }, timeout=3)
-    
+    # only the catalogue download needs it, the protocol modules load without
+    import requests
+
+    headers = {} if etag is None else {'If-None-Match': etag}
+    try:
+        res = requests.get(f'http://{API_DOMAIN}/api/v2/device_product/model', {
+            'lang': lang
+        }, headers=headers, timeout=3)
+    except Exception as e:
+        _LOGGER.info('get_pid_list.request.error: %s', e)
+        return None, None
+
+    if 304 == res.status_code:
+        return None, etag
+
     if 200 != res.status_code:
         _LOGGER.info('get_pid_list.result is none')
-        return []
+        return None, None
     try:
         pid_list = json.loads(res.content)
     except:
         _LOGGER.info('get_pid_list.result is not json')
-        return []
+        return None, None
     
     if pid_list.get('ret') is None:
-        return []
+        return None, None
     
     if '1' != pid_list['ret']:
-        return []
+        return None, None
     
     if pid_list.get('info') is None or type(pid_list.get('info')) is not dict:
-        return []
+        return None, None
     
     if pid_list['info'].get('list') is None or type(pid_list['info']['list']) is not list:
-        return []
+        return None, None
     
-    _CACHE_PID = pid_list['info']['list']    
+    return pid_list['info']['list'], res.headers.get('ETag')
+
+
+def set_pid_list(pid_list: list) -> None:
+    """
+    replace the cached list, e.g. with one loaded from disk, and index it by pid
+    :param pid_list:
+    :return:
+    """
+    global _CACHE_PID, _PID_INDEX
+    index = {}
+    for item in pid_list:
+        for item1 in item.get('m') or []:
+            index[item1['pid']] = {
+                'c': item['c'],
+                'i': item1['i'],
+                'n': item1['n'],
+                'dpid': item1['dpid'],
+            }
+
+    _CACHE_PID = pid_list
+    _PID_INDEX = index
+
+
+def get_pid_list(lang='en') -> list:
+    """
+    cached list, downloaded on the first call
+    :param lang:
+    :return:
+    """
+    if len(_CACHE_PID) != 0:
+        return _CACHE_PID
+
+    pid_list, etag = fetch_pid_list(lang)
+    if pid_list is None:
+        return []
+
+    set_pid_list(pid_list)
     return _CACHE_PID
+
+
+def get_pid_info(pid: str) -> dict:
+    """
+    model of pid, never does network io; load the list first with get_pid_list or set_pid_list
+    :param pid:
+    :return: {'c': type code, 'i': icon, 'n': model name, 'dpid': []} or {}
+    """
+    return _PID_INDEX.get(pid, {})
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import types
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+NAME = 'custom_components.hass_cozylife_local_pull'
+sys.path.insert(0, ROOT)
+# simulator.py, the devices the tests talk to
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+try:
+    import homeassistant  # noqa: F401
+except ImportError:
+    # the integration __init__ needs homeassistant, its protocol modules do not: load them without it
+    package = types.ModuleType(NAME)
+    package.__path__ = [os.path.join(ROOT, 'custom_components', 'hass_cozylife_local_pull')]
+    sys.modules[NAME] = package
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from custom_components.hass_cozylife_local_pull.async_tcp_client import async_tcp_client
+from simulator import ACK_ECHO, ACK_NACK, ACK_REPORT_FIRST, ACK_SILENT, SimulatedDevice
+
+
+def run(test, ack: str = ACK_ECHO, **kwargs) -> None:
+    """
+    run test(client, device) against a client connected to a simulated bulb
+    :param test: coroutine function
+    :param ack: how the device answers CMD_SET
+    :param kwargs: async_tcp_client options
+    :return:
+    """
+    async def main() -> None:
+        device = SimulatedDevice(0, ack=ack)
+        await device.start(0)
+        client = async_tcp_client(device.ip, info=device.info(), **kwargs)
+        client._port = device.port
+        client._timeout = 0.3
+        client._verify_delay = 0.2
+        client.start()
+        try:
+            for _ in range(100):
+                if client.available and client.state:
+                    break
+                await asyncio.sleep(0.01)
+            assert client.state['1'] == 0
+            await test(client, device)
+        finally:
+            await client.async_stop()
+            await device.stop()
+
+    asyncio.run(main())
+
+
+def test_control_is_optimistic_and_confirmed_by_ack():
+    async def test(client, device):
+        changes = []
+        client.add_listener(changes.append)
+        assert await client.async_control({'1': 255}, wait=True)
+        assert client.state['1'] == 255
+        assert changes[0] == {'1': 255}
+        await asyncio.sleep(0.3)
+        assert client.state['1'] == 255
+        assert client.write_counters['rolled_back'] == 0
+
+    run(test)
+
+
+def test_nack_rolls_back():
+    async def test(client, device):
+        changes = []
+        client.add_listener(changes.append)
+        assert not await client.async_control({'1': 255}, wait=True)
+        assert client.state['1'] == 0
+        assert changes == [{'1': 255}, {'1': 0}]
+        assert client.write_counters['rolled_back'] == 1
+
+    run(test, ACK_NACK)
+
+
+def test_report_before_ack_does_not_override():
+    async def test(client, device):
+        changes = []
+        client.add_listener(changes.append)
+        assert await client.async_control({'1': 255}, wait=True)
+        # the report of the old state came first, it must not flip the light back
+        assert {'1': 0} not in changes
+        assert client.state['1'] == 255
+        assert client.write_counters['rolled_back'] == 0
+
+    run(test, ACK_REPORT_FIRST)
+
+
+def test_unacked_set_is_verified_by_query():
+    async def test(client, device):
+        await client.async_control({'1': 255})
+        assert client.state['1'] == 255
+        # the device never took it, the verify query finds the old value
+        await asyncio.sleep(0.5)
+        assert client.state['1'] == 0
+        assert client.write_counters['rolled_back'] == 1
+        assert client._verify_task is None
+
+    run(test, ACK_SILENT)
+
+
+def test_failed_send_rolls_back():
+    async def test(client, device):
+        def broken(cmd, payload):
+            raise OSError('broken pipe')
+
+        client._send = broken
+        assert not await client.async_control({'1': 255}, wait=True)
+        assert client.state['1'] == 0
+        await asyncio.sleep(0.3)
+        assert client._verify_task is None
+
+    run(test)
+
+
+def test_controls_of_a_write_window_share_one_set():
+    async def test(client, device):
+        results = await asyncio.gather(
+            client.async_control({'1': 255}),
+            client.async_control({'4': 500}),
+            client.async_control({'4': 600}),
+        )
+        assert results == [True, True, True]
+        await asyncio.sleep(0.1)
+        assert device.sets == [{'1': 255, '4': 600}]
+        assert client.write_counters == {'sent': 1, 'merged': 2, 'dropped': 1, 'rolled_back': 0}
+        assert client.state['1'] == 255
+        assert client.state['4'] == 600
+
+    run(test, write_window=0.05)
+
+
+def test_reconnect_asks_who_holds_the_ip():
+    stale = []
+
+    async def test(client, device):
+        # a discovery record of the connection it has is not kept for the next connect
+        client.set_info(device.info())
+        # another device takes the ip while the connection is down
+        device.did = f'{0x629168597cb94c4c1d8f + 1:020x}'
+        client.reconnect()
+        for _ in range(200):
+            if client.stale:
+                break
+            await asyncio.sleep(0.01)
+        assert client.stale
+        assert not client.available
+        assert [info['did'] for _, info in stale] == [device.did]
+
+    run(test, on_stale=lambda client, info: stale.append((client, info)))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from custom_components.hass_cozylife_local_pull.const import BRIGHT, HUE, SWITCH
+from custom_components.hass_cozylife_local_pull.effects import (
+    EffectRunner,
+    curve_table,
+    flash_frames,
+    transition_frames,
+)
+
+
+def test_curve_table_ends_at_one():
+    assert curve_table('linear', 4) == [0.25, 0.5, 0.75, 1.0]
+    assert curve_table('ease_in_out', 3)[-1] == 1.0
+    assert curve_table([0, 0.5, 1], 2) == [0.5, 1]
+
+
+def test_transition_frames_carry_only_changed_dpid():
+    frames = transition_frames({SWITCH: 255, BRIGHT: 0}, {SWITCH: 255, BRIGHT: 1000}, 4)
+    assert frames == [{SWITCH: 255, BRIGHT: 250}, {BRIGHT: 500}, {BRIGHT: 750}, {BRIGHT: 1000}]
+
+
+def test_transition_turning_on_fades_up_from_zero():
+    frames = transition_frames({SWITCH: 0, BRIGHT: 800}, {SWITCH: 255}, 2)
+    assert frames == [{SWITCH: 255, BRIGHT: 400}, {BRIGHT: 800}]
+
+
+def test_transition_turning_off_restores_brightness_with_the_off_frame():
+    frames = transition_frames({SWITCH: 255, BRIGHT: 800}, {SWITCH: 0}, 2)
+    assert frames == [{BRIGHT: 400}, {BRIGHT: 800, SWITCH: 0}]
+
+
+def test_transition_hue_takes_the_short_way():
+    frames = transition_frames({HUE: 350}, {HUE: 10}, 2)
+    assert frames == [{HUE: 0}, {HUE: 10}]
+
+
+def test_flash_frames():
+    assert flash_frames({SWITCH: 255}, 2) == [{SWITCH: 0}, {SWITCH: 255}, {SWITCH: 0}, {SWITCH: 255}]
+    assert flash_frames({SWITCH: 0}, 1) == [{SWITCH: 255}, {SWITCH: 0}]
+
+
+def test_runner_sends_every_frame_and_tells_listeners():
+    async def main():
+        sent = []
+
+        async def send(payload):
+            sent.append(payload)
+
+        runner = EffectRunner(send)
+        done = []
+        runner.add_listener(done.append)
+        runner.start('transition', [{BRIGHT: 1}, {BRIGHT: 2}, {BRIGHT: 3}], 10)
+        assert runner.running
+        await asyncio.sleep(0.35)
+        assert sent == [{BRIGHT: 1}, {BRIGHT: 2}, {BRIGHT: 3}]
+        assert done == ['transition']
+        assert runner.counters == {'running': None, 'sent': 3, 'missed': 0}
+
+    asyncio.run(main())
+
+
+def test_runner_merges_missed_frames():
+    async def main():
+        sent = []
+
+        async def slow_send(payload):
+            sent.append(payload)
+            await asyncio.sleep(0.25)
+
+        runner = EffectRunner(slow_send)
+        runner.start('transition', [{BRIGHT: 1}, {BRIGHT: 2, HUE: 5}, {BRIGHT: 3}, {BRIGHT: 4}], 10)
+        await asyncio.sleep(0.7)
+        # the frames due while one was sent go out merged, the last value wins
+        assert sent[0] == {BRIGHT: 1}
+        assert sent[-1][BRIGHT] == 4
+        assert runner.missed == 4 - len(sent)
+        assert any(HUE in payload for payload in sent)
+
+    asyncio.run(main())
+
+
+def test_runner_stop_cancels_a_repeating_effect():
+    async def main():
+        sent = []
+
+        async def send(payload):
+            sent.append(payload)
+
+        runner = EffectRunner(send)
+        runner.start('colorloop', [{HUE: 1}, {HUE: 2}], 10, repeat=True)
+        await asyncio.sleep(0.15)
+        await runner.async_stop()
+        assert not runner.running
+        count = len(sent)
+        await asyncio.sleep(0.2)
+        assert len(sent) == count
+
+    asyncio.run(main())
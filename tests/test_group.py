@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip('homeassistant')
+vol = pytest.importorskip('voluptuous')
+
+from custom_components.hass_cozylife_local_pull.group import SET_MANY_SCHEMA, build_payload, control_many  # noqa: E402
+
+
+class FakeChannel(object):
+
+    def __init__(self, unique_id: str, delay: float = 0.0, acked: bool = True):
+        self.unique_id = unique_id
+        self._delay = delay
+        self._acked = acked
+        self.calls = []
+
+    async def async_control(self, payload: dict, wait: bool = False, timeout=None) -> bool:
+        self.calls.append((payload, wait, timeout))
+        await asyncio.sleep(self._delay)
+        return self._acked
+
+
+def test_build_payload_turns_on_with_color():
+    payload = build_payload({'brightness': 128, 'hs_color': (300, 70)})
+    assert payload == {'1': 255, '2': 0, '4': 512, '5': 300, '6': 700}
+
+
+def test_build_payload_raw_dpid_win():
+    assert build_payload({'state': False, 'data': {1: 255}}) == {'1': 255}
+
+
+def test_schema_coerces_and_checks_ranges():
+    data = SET_MANY_SCHEMA({'entity_id': 'light.a, light.b', 'hs_color': ['300', 70], 'timeout': '5'})
+    assert data['entity_id'] == ['light.a', 'light.b']
+    assert data['hs_color'] == (300.0, 70.0)
+    assert data['timeout'] == 5.0
+    with pytest.raises(vol.Invalid):
+        SET_MANY_SCHEMA({'entity_id': 'light.a', 'brightness': 300})
+    with pytest.raises(vol.Invalid):
+        SET_MANY_SCHEMA({'entity_id': 'light.a', 'hs_color': [300]})
+
+
+def test_schema_checks_raw_dpid():
+    data = SET_MANY_SCHEMA({'entity_id': 'light.a', 'data': {1: '255', '4': 1000}})
+    assert data['data'] == {'1': 255, '4': 1000}
+    with pytest.raises(vol.Invalid):
+        SET_MANY_SCHEMA({'entity_id': 'light.a', 'data': {'on': 1}})
+    with pytest.raises(vol.Invalid):
+        SET_MANY_SCHEMA({'entity_id': 'light.a', 'data': {'1': 'on'}})
+
+
+def test_schema_rejects_off_with_brightness():
+    with pytest.raises(vol.Invalid):
+        SET_MANY_SCHEMA({'entity_id': 'light.a', 'state': False, 'brightness': 10})
+
+
+def test_control_many_shares_one_deadline():
+    async def main():
+        channels = [FakeChannel('a'), FakeChannel('b', acked=False), FakeChannel('c', delay=1)]
+        result = await control_many(channels, {'1': 255}, timeout=0.2)
+        assert result == {'a': True, 'b': False, 'c': False}
+        # the deadline reaches the wait for each ack
+        assert channels[0].calls == [({'1': 255}, True, 0.2)]
+
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+
+import pytest
+
+from custom_components.hass_cozylife_local_pull.protocol import CMD_INFO, CMD_QUERY, CMD_SET, MAX_FRAME_SIZE, \
+    FrameDecoder, Message, PacketEncoder, decode_datagram, parse_info, parse_message
+from bench_frame_decoder import make_frames
+
+SN = '1636463553873'
+INFO = {'did': '629168597cb94c4c1d8f', 'dtp': '02', 'pid': 'e2s64v', 'mac': '7cb94c4c1d8f',
+        'ip': '192.168.123.57', 'rssi': -33, 'sv': '1.0.0', 'hv': '0.0.1'}
+
+
+def dumps(frame: dict) -> bytes:
+    return json.dumps(frame, separators=(',', ':')).encode() + b'\r\n'
+
+
+def fragment(rnd: random.Random, stream: bytes) -> list:
+    chunks = []
+    i = 0
+    while i < len(stream):
+        # mostly tiny pieces, sometimes several frames at once
+        size = rnd.choice([1, 2, 3, rnd.randrange(1, 64), rnd.randrange(64, 8192)])
+        chunks.append(stream[i:i + size])
+        i += size
+
+    return chunks
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fuzz_fragmented_stream(seed):
+    rnd = random.Random(seed)
+    for _ in range(50):
+        frames = make_frames(rnd, rnd.randrange(1, 50))
+        stream = b''.join(dumps(item) for item in frames)
+        decoder = FrameDecoder()
+        decoded = []
+        for chunk in fragment(rnd, stream):
+            decoded.extend(decoder.feed(chunk))
+
+        assert decoded == [parse_message(item) for item in frames]
+        assert 0 == decoder.pending and 0 == decoder.errors
+
+
+def test_decoder_skips_bad_frames():
+    decoder = FrameDecoder()
+    frames = decoder.feed(b'not json\r\n[1, 2]\r\n\r\n' + dumps({'cmd': 10, 'sn': SN, 'msg': {'data': {'1': 0}}}))
+    assert [(item.cmd, item.data) for item in frames] == [(10, {'1': 0})]
+    assert 2 == decoder.errors
+
+
+def test_decoder_drops_oversized_frame():
+    decoder = FrameDecoder()
+    assert [] == decoder.feed(b'{' + b' ' * MAX_FRAME_SIZE)
+    assert 0 == decoder.pending and 1 == decoder.errors
+    # the rest of the dropped frame is not json, the next frame is fine
+    frames = decoder.feed(b'}\r\n' + dumps({'cmd': 3, 'sn': SN, 'res': 0, 'msg': {}}))
+    assert [item.sn for item in frames] == [SN]
+
+
+def test_decoder_delimiter_across_chunks():
+    decoder = FrameDecoder()
+    stream = dumps({'cmd': 2, 'sn': SN, 'msg': {}})
+    assert [] == decoder.feed(stream[:-1])
+    assert [SN] == [item.sn for item in decoder.feed(stream[-1:])]
+
+
+def test_decode_datagram():
+    reply = {'cmd': 0, 'pv': 0, 'sn': '0', 'msg': INFO, 'res': 0}
+    assert decode_datagram(dumps(reply)) == decode_datagram(dumps(reply)[:-2]) == [parse_message(reply)]
+    assert [] == decode_datagram(b'')
+    assert [] == decode_datagram(b'garbage')
+    assert parse_info(decode_datagram(dumps(reply))[0]) == INFO
+
+
+def test_parse_info_needs_did_and_pid():
+    assert parse_info(parse_message({'cmd': 0, 'msg': {'did': INFO['did']}})) is None
+    info = parse_info(parse_message({'cmd': 0, 'msg': {'did': INFO['did'], 'pid': INFO['pid']}}))
+    assert info['did'] == INFO['did'] and info['ip'] is None
+
+
+def test_parse_message():
+    assert parse_message([]) is None
+    assert parse_message('frame') is None
+
+    message = parse_message({'cmd': 3, 'sn': SN, 'res': 1, 'msg': {'attr': [1], 'data': {'1': 255}}})
+    assert (message.cmd, message.sn, message.res, message.data) == (3, SN, 1, {'1': 255})
+    assert message == Message(3, SN, 1, {'attr': [1], 'data': {'1': 255}}, {'1': 255})
+
+    # wrong types are dropped, not trusted
+    message = parse_message({'cmd': '3', 'sn': 1636463553873, 'msg': {'data': [1]}})
+    assert (message.cmd, message.sn, message.res, message.data) == (None, None, None, None)
+    assert parse_message({'cmd': 10, 'msg': 'x'}).msg == {}
+    assert parse_message({'cmd': 10}).msg == {}
+
+
+def test_encode_info_and_query():
+    encoder = PacketEncoder()
+    assert encoder.encode(CMD_INFO, SN, {}) == b'{"pv":0,"cmd":0,"sn":"1636463553873","msg":{}}\r\n'
+    assert encoder.encode(CMD_QUERY, SN, {}) == b'{"pv":0,"cmd":2,"sn":"1636463553873","msg":{"attr":[0]}}\r\n'
+
+
+def test_encode_set():
+    encoder = PacketEncoder()
+    first = encoder.encode(CMD_SET, SN, {'1': 255, '4': 730})
+    assert first == b'{"pv":0,"cmd":3,"sn":"1636463553873","msg":{"attr":[1,4],"data":{"1":255,"4":730}}}\r\n'
+    # the buffer is reused, frames already returned stay as they were
+    encoder.encode(CMD_SET, SN, {'1': 0})
+    assert first.endswith(b'"data":{"1":255,"4":730}}}\r\n')
+
+
+@pytest.mark.parametrize('payload', [{'1': True}, {'7': 'scene', '8': [1, 2]}, {'1': 1.5}])
+def test_encode_set_other_values(payload):
+    frame = json.loads(PacketEncoder().encode(CMD_SET, SN, payload))
+    assert frame == {'pv': 0, 'cmd': 3, 'sn': SN, 'msg': {'attr': [int(key) for key in payload], 'data': payload}}
+
+
+def test_encode_unknown_cmd():
+    with pytest.raises(Exception):
+        PacketEncoder().encode(10, SN, {})
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from custom_components.hass_cozylife_local_pull.state import DeviceState, to_payload, to_states
+
+
+def test_device_state_converts_and_resets():
+    state = DeviceState({'1': 255, '3': 1000, '4': 500, '5': 120, '6': 500})
+    assert (state.on, state.color_temp, state.brightness, state.hs_color) == (True, 0, 125, (120, 50))
+    # a rolled back dpid becomes unknown again, other types are ignored
+    assert state.update({'4': None, '5': 'x'})
+    assert state.brightness is None
+    assert state.hue == 120
+
+
+def test_to_states_matches_device_state():
+    datas = [{'1': 0}, {'1': 255, '4': 1000, '9': 1}]
+    assert [state.as_dict() for state in to_states(datas)] == [DeviceState(data).as_dict() for data in datas]
+
+
+def test_to_payload_round_trip():
+    payload = to_payload({'on': True, 'brightness': 255, 'color_temp': 250, 'hs_color': (10, 100), 'hue': None})
+    assert payload == {'1': 255, '4': 1000, '3': 500, '5': 10, '6': 1000}
+    assert DeviceState(payload).as_dict() == {'on': True, 'work_mode': None, 'color_temp': 250, 'brightness': 250,
+                                              'hue': 10, 'saturation': 100}
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+
+import pytest
+
+from custom_components.hass_cozylife_local_pull import tcp_client as tcp_client_module
+from custom_components.hass_cozylife_local_pull.io_loop import IOLoop
+from custom_components.hass_cozylife_local_pull.tcp_client import tcp_client
+from custom_components.hass_cozylife_local_pull.utils import set_pid_list
+from simulator import SimulatedDevice
+
+# the model simulator.py serves by default
+PID_LIST = [{'c': '01', 'm': [{'pid': 'e2s64v', 'i': '', 'n': 'Bulb', 'dpid': [1, 2, 3, 4, 5, 6]}]}]
+
+
+class DeviceThread(object):
+    """
+    a simulated bulb served by an event loop of its own, tcp_client blocks the test thread
+    """
+
+    def __init__(self, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self.device = SimulatedDevice(0, **kwargs)
+        self._call(self.device.start(0))
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(5)
+
+    def stop(self) -> None:
+        self._call(self.device.stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def wait_for(predicate, timeout: float = 3) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def io_loop(monkeypatch):
+    set_pid_list(PID_LIST)
+    # reconnect at once, backoff_delay is tested on its own
+    monkeypatch.setattr(tcp_client_module, 'backoff_delay', lambda attempt: 0.05)
+    loop = IOLoop()
+    loop.start()
+    yield loop
+    loop.stop()
+
+
+@pytest.fixture
+def device():
+    server = DeviceThread()
+    yield server.device
+    server.stop()
+
+
+def connect(device: SimulatedDevice, io_loop: IOLoop, info: dict = None) -> tcp_client:
+    client = tcp_client(device.ip, info=info, io_loop=io_loop)
+    client._port = device.port
+    client._timeout = 0.3
+    assert wait_for(lambda: client.available)
+    return client
+
+
+def test_handshake(io_loop, device):
+    client = connect(device, io_loop)
+    assert client.device_id == device.did
+    assert client.device_model_name == 'Bulb'
+    assert client.device_type_code == '01'
+    assert client.dpid == [1, 2, 3, 4, 5, 6]
+    client.close()
+
+
+def test_pipelined_queries(io_loop, device):
+    client = connect(device, io_loop, info=device.info())
+    assert client.control({'1': 255})
+    # every query is on the wire before the first reply, each reply finds its waiter by sn
+    futures = [client.query_future() for _ in range(10)]
+    for future in futures:
+        assert future.result(3)['1'] == 255
+    assert device.requests == 11
+    client.close()
+
+
+def test_timeout_reconnects(io_loop, device):
+    client = connect(device, io_loop, info=device.info())
+    device.drop = 1.0
+    start = time.monotonic()
+    assert client.query() == {}
+    assert time.monotonic() - start < 1
+    device.drop = 0
+    assert wait_for(lambda: client.available)
+    assert client.query()['1'] == 0
+    client.close()
+
+
+def test_socket_error_gives_the_slot_back(device):
+    set_pid_list(PID_LIST)
+    loop = IOLoop(max_connects=1)
+    loop.start()
+    try:
+        # socket.gaierror from connect_ex, before any connection exists
+        broken = tcp_client('256.0.0.1', info=device.info(), io_loop=loop)
+        client = tcp_client(device.ip, info=device.info(), io_loop=loop)
+        client._port = device.port
+        assert wait_for(lambda: client.available)
+        assert not broken.available
+        broken.close()
+        client.close()
+        assert wait_for(lambda: 0 == loop.connecting)
+    finally:
+        loop.stop()
+
+
+def test_close_and_stop_fail_fast(io_loop, device):
+    client = connect(device, io_loop, info=device.info())
+    client.close()
+    assert wait_for(lambda: not client.available)
+    assert client.query() == {}
+    assert not client.control({'1': 255})
+
+    other = connect(device, io_loop, info=device.info())
+    io_loop.stop()
+    start = time.monotonic()
+    assert other.query() == {}
+    assert time.monotonic() - start < 0.5
+    other.close()